@@ -12,66 +12,23 @@ import sys
 import os
 import traceback
 import argparse
-import pdfplumber
-from google.cloud import aiplatform
+import asyncio
 
-# Directory setup
-PDF_DIR = "pdfs_simple"
-SUMMARY_DIR = "summaries"
+from edital_core import (PDF_DIR, SUMMARY_DIR, Analyzer, setup_directories, extract_text,
+                         initialize_vertex_ai, write_text_atomic)
 
-def setup_directories():
-    """Create necessary directories if they don't exist."""
-    for directory in [PDF_DIR, SUMMARY_DIR]:
-        os.makedirs(directory, exist_ok=True)
-    print(f"Directories setup complete.")
+# Maximum number of PDFs analyzed concurrently
+MAX_CONCURRENT_ANALYSES = 8
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF using pdfplumber."""
-    print(f"Extracting text from {pdf_path}")
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for i, page in enumerate(pdf.pages):
-                print(f"Processing page {i+1}/{len(pdf.pages)}")
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + "\n"
-                else:
-                    print(f"Warning: No text extracted from page {i+1}")
-        
-        if not text.strip():
-            print("Warning: No text was extracted from the PDF. It might be a scanned document.")
-        else:
-            print(f"Successfully extracted {len(text)} characters of text")
-        
-        return text
-    except Exception as e:
-        print(f"Failed to extract text from {pdf_path}: {e}")
-        traceback.print_exc()
-        return ""
-
-def initialize_vertex_ai(project_id, location):
-    """Initialize the Vertex AI client."""
-    try:
-        print(f"Initializing Vertex AI with project: {project_id}, location: {location}")
-        aiplatform.init(project=project_id, location=location)
-        return True
-    except Exception as e:
-        print(f"Error initializing Vertex AI: {e}")
-        traceback.print_exc()
-        return False
+# Only this many characters of a document are sent to Gemini, so extraction stops there
+MAX_TEXT_CHARS = 30000
 
-def analyze_with_gemini(text, model_name="gemini-2.0-flash-lite-001"):
-    """Analyze text using Vertex AI Gemini model."""
+async def analyze_with_gemini(text, analyzer):
+    """Analyze text with the analyzer's Gemini model without blocking the event loop."""
     if not text.strip():
         return "No text content to analyze."
     
     try:
-        print(f"Sending text to Gemini model ({model_name}) for analysis...")
-        
-        # Initialize the model
-        model = aiplatform.GenerativeModel(model_name)
-        
         # Prepare the prompt
         prompt = f"""
         Please analyze the following procurement document (edital) and provide the following specific information:
@@ -98,62 +55,77 @@ def analyze_with_gemini(text, model_name="gemini-2.0-flash-lite-001"):
         If the text appears to be truncated, please note that in your analysis.
         """
         
-        # Send to the model
-        response = model.generate_content(prompt)
+        # Send to the model (or reuse a cached response for the exact same model and prompt)
+        analysis = await analyzer.analyze_async(prompt)
         
-        # Extract the analysis from the response
-        if hasattr(response, 'text'):
-            analysis = response.text
-            print("Successfully generated analysis")
-            return analysis
-        else:
-            print("Warning: Unexpected response format from Gemini API")
+        if analysis is None:
             return "Error: Could not generate analysis due to unexpected API response format."
+        print("Successfully generated analysis")
+        return analysis
     
     except Exception as e:
         print(f"Error during analysis: {e}")
         traceback.print_exc()
         return f"Error generating analysis: {str(e)}"
 
-def process_pdfs_for_analysis(project_id, location, model_name="gemini-2.0-flash-lite-001"):
-    """Process all PDFs in PDF_DIR and save analyses to SUMMARY_DIR."""
-    pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith('.pdf')]
-    
-    if not pdf_files:
-        print("No PDF files found to analyze.")
-        return
-    
-    print(f"Found {len(pdf_files)} PDF files to analyze.")
-    
-    for pdf_file in pdf_files:
+def analysis_filename(pdf_file):
+    """Return the name of the analysis file written for a PDF."""
+    return f"analysis_{pdf_file.replace('.pdf', '.txt')}"
+
+async def analyze_pdf(pdf_file, analyzer, semaphore):
+    """Extract, analyze and save a single PDF, bounded by the shared semaphore."""
+    async with semaphore:
         pdf_path = os.path.join(PDF_DIR, pdf_file)
-        analysis_file = os.path.join(SUMMARY_DIR, f"analysis_{pdf_file.replace('.pdf', '.txt')}")
-        
-        # Skip if analysis already exists
-        if os.path.exists(analysis_file):
-            print(f"Analysis already exists for {pdf_file}, skipping.")
-            continue
+        analysis_file = os.path.join(SUMMARY_DIR, analysis_filename(pdf_file))
         
         print(f"\nProcessing {pdf_file} for analysis...")
         
-        # Extract text from PDF
-        text = extract_text_from_pdf(pdf_path)
+        # Extract text from PDF (CPU-bound, keep it off the event loop)
+        text = await asyncio.to_thread(extract_text, pdf_path, MAX_TEXT_CHARS)
         
         if not text.strip():
             print(f"No text extracted from {pdf_file}, skipping analysis.")
-            with open(analysis_file, "w", encoding="utf-8") as f:
-                f.write("No text content could be extracted from this PDF. It might be a scanned document or contain only images.")
-            continue
+            write_text_atomic(analysis_file, "No text content could be extracted from this PDF. It might be a scanned document or contain only images.")
+            return
         
         # Analyze the text
-        analysis = analyze_with_gemini(text, model_name)
+        analysis = await analyze_with_gemini(text, analyzer)
         
         # Save the analysis
-        with open(analysis_file, "w", encoding="utf-8") as f:
-            f.write(analysis)
+        write_text_atomic(analysis_file, analysis)
         
         print(f"Saved analysis for {pdf_file} to {analysis_file}")
 
+async def analyze_pdfs(pdf_files, analyzer, max_concurrency):
+    """Analyze the given PDFs concurrently, at most max_concurrency at a time."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    await asyncio.gather(*(analyze_pdf(pdf_file, analyzer, semaphore) for pdf_file in pdf_files))
+
+def process_pdfs_for_analysis(project_id, location, model_name="gemini-2.0-flash-lite-001",
+                              max_concurrency=MAX_CONCURRENT_ANALYSES):
+    """Process all PDFs in PDF_DIR and save analyses to SUMMARY_DIR."""
+    pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith('.pdf')]
+    
+    if not pdf_files:
+        print("No PDF files found to analyze.")
+        return
+    
+    print(f"Found {len(pdf_files)} PDF files to analyze.")
+    
+    # Skip PDFs that already have an analysis with a single directory listing
+    existing_analyses = set(os.listdir(SUMMARY_DIR))
+    pending_files = [f for f in pdf_files if analysis_filename(f) not in existing_analyses]
+    skipped = len(pdf_files) - len(pending_files)
+    if skipped:
+        print(f"Analysis already exists for {skipped} PDF files, skipping them.")
+    
+    if not pending_files:
+        return
+    
+    # One model instance is shared by every PDF
+    analyzer = Analyzer(model_name)
+    asyncio.run(analyze_pdfs(pending_files, analyzer, max_concurrency))
+
 def main():
     """Main function to handle analyzing PDFs."""
     parser = argparse.ArgumentParser(description="Analyze procurement documents using Gemini.")
@@ -161,6 +133,8 @@ def main():
     parser.add_argument("--location", help="Google Cloud location", default="us-central1")
     parser.add_argument("--model", help="Gemini model name", default="gemini-2.0-flash-lite-001")
     parser.add_argument("--pdf", help="Specific PDF file to analyze (optional)")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_ANALYSES,
+                        help="Maximum number of PDFs analyzed in parallel")
     
     args = parser.parse_args()
     
@@ -191,28 +165,26 @@ def main():
         
         # Extract filename
         pdf_file = os.path.basename(pdf_path)
-        analysis_file = os.path.join(SUMMARY_DIR, f"analysis_{pdf_file.replace('.pdf', '.txt')}")
+        analysis_file = os.path.join(SUMMARY_DIR, analysis_filename(pdf_file))
         
         # Extract text from PDF
-        text = extract_text_from_pdf(pdf_path)
+        text = extract_text(pdf_path, MAX_TEXT_CHARS)
         
         if not text.strip():
             print(f"No text extracted from {pdf_file}, skipping analysis.")
-            with open(analysis_file, "w", encoding="utf-8") as f:
-                f.write("No text content could be extracted from this PDF. It might be a scanned document or contain only images.")
+            write_text_atomic(analysis_file, "No text content could be extracted from this PDF. It might be a scanned document or contain only images.")
             return 1
         
         # Analyze the text
-        analysis = analyze_with_gemini(text, args.model)
+        analysis = asyncio.run(analyze_with_gemini(text, Analyzer(args.model)))
         
         # Save the analysis
-        with open(analysis_file, "w", encoding="utf-8") as f:
-            f.write(analysis)
+        write_text_atomic(analysis_file, analysis)
         
         print(f"Saved analysis for {pdf_file} to {analysis_file}")
     else:
         # Process all PDFs
-        process_pdfs_for_analysis(project_id, args.location, args.model)
+        process_pdfs_for_analysis(project_id, args.location, args.model, args.concurrency)
     
     print("\nAnalysis complete!")
     return 0
@@ -1,72 +1,21 @@
 #!/usr/bin/env python3
 import os
 import argparse
-import pdfplumber
+import hashlib
 import traceback
-from datetime import datetime
-from google.cloud import aiplatform
-from vertexai.preview.generative_models import GenerativeModel, Part
+from datetime import datetime, timedelta
 
-# Configuration
-PDF_DIR = "pdfs_simple"  # Folder containing PDFs
-SUMMARY_DIR = "summaries"  # Folder for analysis results
-
-def setup_directories():
-    """Create necessary directories if they don't exist."""
-    os.makedirs(PDF_DIR, exist_ok=True)
-    os.makedirs(SUMMARY_DIR, exist_ok=True)
-    print(f"Directories set up: {PDF_DIR}, {SUMMARY_DIR}")
+from edital_core import (PDF_DIR, SUMMARY_DIR, Analyzer, setup_directories, extract_text,
+                         initialize_vertex_ai, write_text_atomic)
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file using pdfplumber."""
-    print(f"Extracting text from {pdf_path}...")
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for i, page in enumerate(pdf.pages):
-                print(f"Processing page {i+1}/{len(pdf.pages)}")
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + "\n"
-                else:
-                    print(f"Warning: No text extracted from page {i+1}")
-        
-        if not text.strip():
-            print("Warning: No text was extracted from the PDF. It might be a scanned document.")
-            return ""
-        
-        print(f"Successfully extracted {len(text)} characters of text")
-        return text.strip()
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        traceback.print_exc()
-        return ""
-
-def initialize_vertex_ai(project_id, location):
-    """Initialize Vertex AI with the specified project and location."""
-    try:
-        print(f"Initializing Vertex AI with project: {project_id}, location: {location}")
-        aiplatform.init(project=project_id, location=location)
-        return True
-    except Exception as e:
-        print(f"Error initializing Vertex AI: {e}")
-        traceback.print_exc()
-        return False
+# Configuration
+MAX_TEXT_CHARS = 50000  # Documents longer than this are cut down to their head and tail
+HEAD_CHARS = 20000  # Characters kept from the start of a long document
+TAIL_CHARS = 30000  # Characters kept from the end of a long document (Termo de Referência)
+PROMPT_CACHE_TTL = timedelta(hours=1)  # Lifetime of the Vertex AI context cache for the prompt
 
-def analyze_with_gemini(text, model_id="gemini-2.0-flash-lite-001"):
-    """Send text to Gemini model via Vertex AI for analysis."""
-    if not text:
-        return "No text available for analysis."
-    
-    try:
-        print(f"Analyzing text with Gemini model: {model_id}...")
-        
-        # Initialize the Gemini model
-        model = GenerativeModel(model_id)
-        print(f"Model initialized: {model_id}")
-        
-        # Updated prompt for table extraction with specific guidance about the Termo de Referência
-        prompt = """
+# Prompt for table extraction with specific guidance about the Termo de Referência
+ANALYSIS_PROMPT = """
         Analise este documento de licitação e extraia as seguintes informações, priorizando tabelas e listas que contenham descrições de itens, quantidades e unidades. Formate a resposta de forma clara e organizada, com cada item em uma seção separada. Se alguma informação não estiver disponível no documento, indique "Não especificado".
 
         IMPORTANTE: Procure especificamente na seção "ANEXO I - TERMO DE REFERÊNCIA" ou "TERMO DE REFERÊNCIA" que geralmente começa após a página 20 do documento. Esta seção contém as tabelas com as especificações detalhadas dos produtos.
@@ -99,32 +48,58 @@ def analyze_with_gemini(text, model_id="gemini-2.0-flash-lite-001"):
 
         Documento:
         """
+
+# Generation settings for the analysis
+GENERATION_CONFIG = {
+    "max_output_tokens": 2048,  # Increased from 1024
+    "temperature": 0.2,
+    "top_p": 0.9,
+    "top_k": 40
+}
+
+def create_prompt_cache(model_id, ttl=PROMPT_CACHE_TTL):
+    """Return a Vertex AI context cache holding ANALYSIS_PROMPT, reusing a live one if present."""
+    from vertexai.preview import caching
+    
+    prompt_hash = hashlib.sha256(ANALYSIS_PROMPT.encode("utf-8")).hexdigest()[:16]
+    display_name = f"edital-prompt-{prompt_hash}"
+    try:
+        for cached_content in caching.CachedContent.list():
+            if cached_content.display_name == display_name and cached_content.model_name.endswith(model_id):
+                print(f"Reusing prompt cache: {cached_content.name}")
+                return cached_content
         
+        cached_content = caching.CachedContent.create(
+            model_name=model_id,
+            contents=[ANALYSIS_PROMPT],
+            ttl=ttl,
+            display_name=display_name,
+        )
+        print(f"Created prompt cache: {cached_content.name}")
+        return cached_content
+    except Exception as e:
+        # Caching requires a minimum prompt size and a supported model; fall back to inline prompts
+        print(f"Could not use a prompt cache, sending the prompt inline: {e}")
+        return None
+
+def analyze_with_gemini(text, analyzer):
+    """Send text to the analyzer's Gemini model for analysis."""
+    if not text:
+        return "No text available for analysis."
+    
+    try:
         # Increase the character limit to include more of the document
-        max_chars = 50000  # Doubled from previous 25000
-        if len(text) > max_chars:
+        if len(text) > MAX_TEXT_CHARS:
             # Take the first 20000 characters and the last 30000 characters to capture both header info and the Termo de Referência
-            first_part = text[:20000]
-            last_part = text[-30000:] if len(text) > 30000 else text[20000:]
+            first_part = text[:HEAD_CHARS]
+            last_part = text[-TAIL_CHARS:] if len(text) > TAIL_CHARS else text[HEAD_CHARS:]
             text = first_part + "\n...[texto intermediário omitido]...\n" + last_part
         
-        # Generate content with increased output tokens
-        response = model.generate_content(
-            prompt + text,
-            generation_config={
-                "max_output_tokens": 2048,  # Increased from 1024
-                "temperature": 0.2,
-                "top_p": 0.9,
-                "top_k": 40
-            }
-        )
-        
-        # Extract the response text
-        if hasattr(response, 'text'):
-            return response.text
-        else:
-            print("Warning: Unexpected response format")
-            return str(response)
+        # Send the document (or reuse a cached response for the same model, prompt and document)
+        analysis = analyzer.analyze(text)
+        if analysis is None:
+            return "Analysis failed due to an unexpected response format."
+        return analysis
             
     except Exception as e:
         print(f"Error analyzing text with Gemini: {e}")
@@ -137,8 +112,7 @@ def save_analysis(analysis, pdf_name):
     output_file = os.path.join(SUMMARY_DIR, f"analysis_{pdf_name.replace('.pdf', '')}.txt")
     
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(analysis)
+        write_text_atomic(output_file, analysis)
         print(f"Analysis saved to {output_file}")
         return output_file
     except Exception as e:
@@ -146,16 +120,16 @@ def save_analysis(analysis, pdf_name):
         traceback.print_exc()
         return None
 
-def process_pdf(pdf_path, project_id, location, model_id):
+def process_pdf(pdf_path, analyzer):
     """Process a single PDF: extract text and analyze with Gemini."""
     # Extract text
-    text = extract_text_from_pdf(pdf_path)
+    text = extract_text(pdf_path, HEAD_CHARS, TAIL_CHARS)
     if not text:
         print(f"No text extracted from {pdf_path}. Skipping analysis.")
         return False
     
     # Analyze with Gemini
-    analysis = analyze_with_gemini(text, model_id)
+    analysis = analyze_with_gemini(text, analyzer)
     
     # Save analysis
     pdf_name = os.path.basename(pdf_path)
@@ -171,6 +145,8 @@ def main():
     parser.add_argument("--model-id", default="gemini-2.0-flash-lite-001", help="Gemini model ID")
     parser.add_argument("--pdf", required=True, help="PDF file to analyze")
     parser.add_argument("--pdf-dir", default=PDF_DIR, help="Directory containing PDFs")
+    parser.add_argument("--context-cache", action="store_true",
+                        help="Cache the analysis prompt with Vertex AI context caching and reuse it across runs")
     
     args = parser.parse_args()
     
@@ -194,8 +170,12 @@ def main():
         print(f"Error: PDF file not found at {pdf_path}")
         return
     
+    # Cache the static prompt prefix so each request only sends the document text
+    cached_content = create_prompt_cache(args.model_id) if args.context_cache else None
+    
     # Process the PDF
-    success = process_pdf(pdf_path, args.project_id, args.location, args.model_id)
+    analyzer = Analyzer(args.model_id, ANALYSIS_PROMPT, GENERATION_CONFIG, cached_content)
+    success = process_pdf(pdf_path, analyzer)
     
     if success:
         print("Analysis complete!")
@@ -4,13 +4,102 @@ Script to download and extract files from a specific URL
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sys
 import os
 import subprocess
 import shutil
 import traceback
 import argparse
+import io
 import re
+import zipfile
+
+try:
+    import rarfile
+except ImportError:  # RARs are then handed to unar
+    rarfile = None
+
+# Errors from in-process extraction that should fall back to unar. zipfile raises
+# NotImplementedError for unsupported methods (e.g. Deflate64) and RuntimeError for
+# encrypted members, both of which unar can handle
+ARCHIVE_ERRORS = (zipfile.BadZipFile, NotImplementedError, RuntimeError)
+if rarfile:
+    ARCHIVE_ERRORS += (rarfile.Error,)
+
+# Chunk size used when streaming downloads to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# (connect, read) timeout in seconds for HTTP requests
+REQUEST_TIMEOUT = (5, 60)
+
+# Shared session: keeps connections alive between requests and retries transient failures
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16,
+                       max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504)))
+SESSION.mount('https://', _adapter)
+SESSION.mount('http://', _adapter)
+
+# Patterns compiled once at import time
+PNCP_ID_RE = re.compile(r'PNCP-(\d+)-(\d+)-(\d+)-(\d+)')
+FILENAME_RE = re.compile(r'filename=[\'"]?([^\'"]+)')
+UNSAFE_FILENAME_CHARS_RE = re.compile(r'[^\w\-\.]')
+
+def save_response_body(body, file_path):
+    """Stream a response body to disk in COPY_BUFFER_SIZE chunks."""
+    with open(file_path, 'wb', buffering=COPY_BUFFER_SIZE) as f:
+        shutil.copyfileobj(body, f, COPY_BUFFER_SIZE)
+
+def extract_archive(archive_path, dest_dir):
+    """Extract a ZIP or RAR archive in-process, falling back to unar for anything else.
+    
+    Raises subprocess.CalledProcessError or FileNotFoundError when the unar fallback fails.
+    """
+    with open(archive_path, 'rb') as f:
+        head = f.read(8)
+    
+    try:
+        if head.startswith(b'PK\x03\x04'):
+            with zipfile.ZipFile(archive_path) as archive:
+                archive.extractall(dest_dir)
+            return
+        if head.startswith(b'Rar!') and rarfile is not None:
+            with rarfile.RarFile(archive_path) as archive:
+                archive.extractall(dest_dir)
+            return
+    except ARCHIVE_ERRORS as e:
+        print(f"In-process extraction of {archive_path} failed ({e}), retrying with unar")
+    
+    result = subprocess.run(['unar', '-force-overwrite', '-o', dest_dir, archive_path],
+                            capture_output=True, text=True, check=True)
+    print(result.stdout)
+
+def link_or_copy(src, dest):
+    """Hard-link src to dest, copying instead when linking is not possible (e.g. across filesystems)."""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+        return "Linked"
+    except OSError:
+        shutil.copy2(src, dest)
+        return "Copied"
+
+def scan_extracted_files(root_dir):
+    """Walk root_dir once, printing every file and returning the PDF and RAR paths found."""
+    pdf_files = []
+    rar_files = []
+    for root, _, files in os.walk(root_dir):
+        for file in files:
+            path = os.path.join(root, file)
+            print(f"- {path}")
+            lower_name = file.lower()
+            if lower_name.endswith('.pdf'):
+                pdf_files.append(path)
+            elif lower_name.endswith('.rar'):
+                rar_files.append(path)
+    return pdf_files, rar_files
 
 def main():
     # Prompt the user for the URL
@@ -22,7 +111,7 @@ def main():
     # Check if it's an AlertaLicitacao URL
     if 'alertalicitacao.com.br' in url:
         print(f"Processing AlertaLicitacao URL: {url}")
-        pncp_id_match = re.search(r'PNCP-(\d+)-(\d+)-(\d+)-(\d+)', url)
+        pncp_id_match = PNCP_ID_RE.search(url)
         if pncp_id_match:
             cnpj = pncp_id_match.group(1)
             sequence = pncp_id_match.group(2)
@@ -54,15 +143,21 @@ def main():
         }
         
         print(f"Sending GET request to {url}")
-        response = requests.get(url, headers=headers)
+        response = SESSION.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT)
         print(f"Status code: {response.status_code}")
         print(f"Content type: {response.headers.get('Content-Type')}")
-        print(f"Content length: {len(response.content)} bytes")
+        print(f"Content length: {response.headers.get('Content-Length', 'unknown')} bytes")
         
         if response.status_code == 200:
+            # Peek at the first bytes to sniff the file type without consuming them;
+            # the whole body, magic bytes included, is then streamed to disk
+            response.raw.decode_content = True
+            body = io.BufferedReader(response.raw, COPY_BUFFER_SIZE)
+            head = body.peek(16)[:16]
+            
             # Try to get the filename from the Content-Disposition header
             content_disposition = response.headers.get('Content-Disposition', '')
-            filename_match = re.search(r'filename=[\'"]?([^\'"]+)', content_disposition)
+            filename_match = FILENAME_RE.search(content_disposition)
             
             if filename_match:
                 filename = filename_match.group(1)
@@ -78,11 +173,11 @@ def main():
                     ext = '.rar'
                 else:
                     # Try to guess the extension from the first few bytes
-                    if response.content.startswith(b'%PDF'):
+                    if head.startswith(b'%PDF'):
                         ext = '.pdf'
-                    elif response.content.startswith(b'PK\x03\x04'):
+                    elif head.startswith(b'PK\x03\x04'):
                         ext = '.zip'
-                    elif response.content.startswith(b'Rar!'):
+                    elif head.startswith(b'Rar!'):
                         ext = '.rar'
                     else:
                         # Default to .bin if we can't determine the type
@@ -93,71 +188,62 @@ def main():
                 print(f"Generated filename: {filename}")
             
             # Clean the filename
-            filename = re.sub(r'[^\w\-\.]', '_', filename)
+            filename = UNSAFE_FILENAME_CHARS_RE.sub('_', filename)
             
             # Determine if the file is a PDF
             is_pdf = ('application/pdf' in response.headers.get('Content-Type', '') or 
                      filename.lower().endswith('.pdf') or
-                     response.content.startswith(b'%PDF'))
+                     head.startswith(b'%PDF'))
             
             if is_pdf:
                 # If it's a PDF, save directly to the pdf_dir
                 file_path = os.path.join(pdf_dir, filename)
                 print(f"Detected PDF file, saving directly to PDF directory: {file_path}")
-                with open(file_path, 'wb') as f:
-                    f.write(response.content)
+                save_response_body(body, file_path)
                 print(f"Successfully saved PDF to {file_path}")
                 return 0
             
             # For non-PDF files, proceed with the normal download and extraction process
             file_path = os.path.join(output_dir, filename)
             print(f"Saving file to: {file_path}")
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
+            save_response_body(body, file_path)
             print(f"Successfully downloaded file to {file_path}")
             
             # Extract only if it's not a PDF
             print(f"Extracting {file_path} to {extract_dir}")
             try:
-                result = subprocess.run(['unar', '-force-overwrite', '-o', extract_dir, file_path], 
-                                      capture_output=True, text=True, check=True)
-                print(result.stdout)
+                extract_archive(file_path, extract_dir)
                 print("Extraction successful!")
                 
-                # List the extracted files
+                # List the extracted files, collecting PDFs and nested RARs in the same walk
                 print("\nListing extracted files:")
-                for root, dirs, files in os.walk(extract_dir):
-                    for file in files:
-                        print(f"- {os.path.join(root, file)}")
+                pdf_files, rar_files = scan_extracted_files(extract_dir)
+                seen_pdfs = set(pdf_files)
                 
-                # Look for RAR files and extract them
-                for root, dirs, files in os.walk(extract_dir):
-                    for file in files:
-                        if file.lower().endswith('.rar'):
-                            rar_file = os.path.join(root, file)
-                            print(f"\nFound RAR file: {rar_file}")
-                            
-                            # Create a subdirectory for this RAR file
-                            rar_extract_dir = os.path.join(extract_dir, os.path.splitext(file)[0])
-                            os.makedirs(rar_extract_dir, exist_ok=True)
-                            
-                            # Extract the RAR file
-                            print(f"Extracting RAR file to {rar_extract_dir}")
-                            try:
-                                rar_result = subprocess.run(['unar', '-force-overwrite', '-o', rar_extract_dir, rar_file], 
-                                                         capture_output=True, text=True, check=True)
-                                print(rar_result.stdout)
-                                print("RAR extraction successful!")
-                            except subprocess.CalledProcessError as e:
-                                print(f"Error extracting RAR file: {e}")
-                                print(f"Error output: {e.stderr}")
-                
-                # Look for PDF files and copy them to the PDF directory
-                pdf_files = []
-                for root, dirs, files in os.walk(extract_dir):
-                    for file in files:
-                        if file.lower().endswith('.pdf'):
-                            pdf_files.append(os.path.join(root, file))
+                # Extract the nested RAR files and pick up the PDFs they contain
+                for rar_file in rar_files:
+                    print(f"\nFound RAR file: {rar_file}")
+                    
+                    # Create a subdirectory for this RAR file
+                    rar_name = os.path.splitext(os.path.basename(rar_file))[0]
+                    rar_extract_dir = os.path.join(extract_dir, rar_name)
+                    os.makedirs(rar_extract_dir, exist_ok=True)
+                    
+                    # Extract the RAR file
+                    print(f"Extracting RAR file to {rar_extract_dir}")
+                    try:
+                        extract_archive(rar_file, rar_extract_dir)
+                        print("RAR extraction successful!")
+                    except subprocess.CalledProcessError as e:
+                        print(f"Error extracting RAR file: {e}")
+                        print(f"Error output: {e.stderr}")
+                        continue
+                    
+                    nested_pdfs, _ = scan_extracted_files(rar_extract_dir)
+                    for pdf_file in nested_pdfs:
+                        if pdf_file not in seen_pdfs:
+                            seen_pdfs.add(pdf_file)
+                            pdf_files.append(pdf_file)
                 
                 if pdf_files:
                     print(f"\nFound {len(pdf_files)} PDF files:")
@@ -172,10 +258,10 @@ def main():
                         # Create a destination path
                         dest_path = os.path.join(pdf_dir, base_name)
                         
-                        # Copy the file
+                        # Link the file (no bytes are copied on the same filesystem)
                         try:
-                            shutil.copy2(pdf_file, dest_path)
-                            print(f"Copied {pdf_file} to {dest_path}")
+                            action = link_or_copy(pdf_file, dest_path)
+                            print(f"{action} {pdf_file} to {dest_path}")
                         except Exception as e:
                             print(f"Error copying {pdf_file}: {e}")
                     
@@ -9,105 +9,262 @@ This script extends the original Edital Downloader and Extractor project to:
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sys
 import os
 import subprocess
 import shutil
 import traceback
 import argparse
+import functools
+import hashlib
+import io
+import json
 import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pdfplumber
 from google.cloud import aiplatform
 
+try:
+    import rarfile
+except ImportError:  # RARs are then handed to unar
+    rarfile = None
+
 # Directory setup
 DOWNLOAD_DIR = "downloads_simple"
 EXTRACTED_DIR = "extracted_simple"
 PDF_DIR = "pdfs_simple"
 SUMMARY_DIR = "summaries"
+TEXT_CACHE_DIR = os.path.join(PDF_DIR, ".cache")
+
+# Upper bound on processes used for PDF text extraction
+MAX_EXTRACTION_WORKERS = 6
+
+# A lone PDF with at least this many pages is split across worker processes by page range
+PARALLEL_PAGE_THRESHOLD = 20
+
+# Documents summarized per endpoint.predict call; 16 prompts of MAX_INPUT_TOKENS stay well under the input limit
+SUMMARY_BATCH_SIZE = 16
+
+# Generation parameters for summarization
+SUMMARY_PARAMETERS = {
+    "temperature": 0.2,  # Lower temperature for more factual output
+    "maxOutputTokens": 1024,  # Reasonable summary length
+    "topK": 40,
+    "topP": 0.95,
+}
+
+# Per-document input budget for summarization, and the tokenizer used to measure it
+MAX_INPUT_TOKENS = 32000
+TOKENIZER_MODEL = "gemini-1.5-flash-002"
+CHARS_PER_TOKEN = 4  # Rough estimate used when the tokenizer is unavailable
+
+# Marker placed before each page's text, so documents can be trimmed on page boundaries
+PAGE_MARKER = "\n--- PAGE {} ---\n"
+PAGE_SPLIT_RE = re.compile(r'(?=\n--- PAGE \d+ ---\n)')
+
+# Extensions of archives found inside downloaded archives that are extracted too
+ARCHIVE_SUFFIXES = ('.rar', '.zip')
+MAX_ARCHIVE_DEPTH = 5  # Guards against archives that (indirectly) contain themselves
+
+# Errors from in-process extraction that should fall back to unar. zipfile raises
+# NotImplementedError for unsupported methods (e.g. Deflate64) and RuntimeError for
+# encrypted members, both of which unar can handle
+ARCHIVE_ERRORS = (zipfile.BadZipFile, NotImplementedError, RuntimeError)
+if rarfile:
+    ARCHIVE_ERRORS += (rarfile.Error,)
+
+# File extensions by leading magic bytes and by Content-Type
+MAGIC_EXTENSIONS = {
+    b'%PDF': '.pdf',
+    b'PK\x03\x04': '.zip',
+    b'Rar!\x1a\x07': '.rar',
+    b'7z\xbc\xaf\x27\x1c': '.7z',
+    b'\x1f\x8b': '.gz',
+}
+CONTENT_TYPE_EXTENSIONS = {
+    'application/pdf': '.pdf',
+    'application/zip': '.zip',
+    'application/x-rar-compressed': '.rar',
+}
+
+# Patterns compiled once at import time
+PNCP_ID_RE = re.compile(r'PNCP-(\d+)-(\d+)-(\d+)-(\d+)')
+FILENAME_RE = re.compile(r'filename=[\'"]?([^\'"]+)')
+UNSAFE_FILENAME_CHARS_RE = re.compile(r'[^\w\-\.]')
+
+# Batch prediction (--batch-gcs-prefix): model used and seconds between job status checks
+DEFAULT_BATCH_MODEL = "gemini-1.5-flash-002"
+BATCH_POLL_INTERVAL = 30
+
+# Maximum number of files downloaded at the same time with --urls-file
+MAX_CONCURRENT_DOWNLOADS = 8
+
+# Chunk size used when streaming downloads to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# (connect, read) timeout in seconds for HTTP requests
+REQUEST_TIMEOUT = (10, 60)
+
+# Shared session: keeps connections alive between downloads and retries transient failures
+SESSION = requests.Session()
+SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+})
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                       max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504)))
+SESSION.mount('https://', _adapter)
+SESSION.mount('http://', _adapter)
 
 def setup_directories():
     """Create necessary directories if they don't exist."""
-    for directory in [DOWNLOAD_DIR, EXTRACTED_DIR, PDF_DIR, SUMMARY_DIR]:
+    for directory in [DOWNLOAD_DIR, EXTRACTED_DIR, PDF_DIR, SUMMARY_DIR, TEXT_CACHE_DIR]:
         os.makedirs(directory, exist_ok=True)
     print(f"Directories setup complete.")
 
-def download_file(url, headers=None):
+def save_response_body(body, file_path):
+    """Stream a response body to disk in COPY_BUFFER_SIZE chunks."""
+    with open(file_path, 'wb', buffering=COPY_BUFFER_SIZE) as f:
+        shutil.copyfileobj(body, f, COPY_BUFFER_SIZE)
+
+def download_file(url, headers=None, dest_dir=DOWNLOAD_DIR):
     """
-    Download a file from a URL and determine its filename.
+    Download a file from a URL into dest_dir and determine its filename.
+    Extra headers are added to the session's defaults.
     Returns (success, file_path, is_pdf)
     """
-    if headers is None:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-    
     print(f"Sending GET request to {url}")
     try:
-        response = requests.get(url, headers=headers)
-        print(f"Status code: {response.status_code}")
-        print(f"Content type: {response.headers.get('Content-Type')}")
-        print(f"Content length: {len(response.content)} bytes")
-        
-        if response.status_code != 200:
-            print(f"Error: Received status code {response.status_code}")
-            return False, None, False
-        
-        # Try to get the filename from the Content-Disposition header
-        content_disposition = response.headers.get('Content-Disposition', '')
-        filename_match = re.search(r'filename=[\'"]?([^\'"]+)', content_disposition)
-        
-        if filename_match:
-            filename = filename_match.group(1)
-            print(f"Extracted filename from Content-Disposition: {filename}")
-        else:
-            # Try to guess the file extension based on the content
-            content_type = response.headers.get('Content-Type', '')
-            if 'application/pdf' in content_type:
-                ext = '.pdf'
-            elif 'application/zip' in content_type:
-                ext = '.zip'
-            elif 'application/x-rar-compressed' in content_type:
-                ext = '.rar'
-            else:
-                # Try to guess the extension from the first few bytes
-                if response.content.startswith(b'%PDF'):
-                    ext = '.pdf'
-                elif response.content.startswith(b'PK\x03\x04'):
-                    ext = '.zip'
-                elif response.content.startswith(b'Rar!'):
-                    ext = '.rar'
-                else:
-                    # Default to .bin if we can't determine the type
-                    ext = '.bin'
-            
-            # Create a default filename
-            filename = f"download{ext}"
-            print(f"Generated filename: {filename}")
-        
-        # Clean the filename
-        filename = re.sub(r'[^\w\-\.]', '_', filename)
-        
-        # Determine if the file is a PDF
-        is_pdf = ('application/pdf' in response.headers.get('Content-Type', '') or 
-                 filename.lower().endswith('.pdf') or
-                 response.content.startswith(b'%PDF'))
-        
-        # Save the file
-        file_path = os.path.join(DOWNLOAD_DIR, filename)
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
-        print(f"Successfully downloaded file to {file_path}")
-        
-        return True, file_path, is_pdf
+        with SESSION.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            return save_download(response, dest_dir)
     
     except Exception as e:
         print(f"Error downloading file: {e}")
         traceback.print_exc()
         return False, None, False
 
+def download_many(urls, max_workers=MAX_CONCURRENT_DOWNLOADS):
+    """
+    Download several URLs concurrently over the shared session.
+    Each download gets its own numbered folder under DOWNLOAD_DIR, since files are often
+    all named download.zip. Returns a (success, file_path, is_pdf) tuple per URL, in order.
+    """
+    dest_dirs = [os.path.join(DOWNLOAD_DIR, str(index)) for index in range(1, len(urls) + 1)]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        return list(executor.map(lambda url, dest_dir: download_file(url, dest_dir=dest_dir), urls, dest_dirs))
+
+def sniff_extension(head):
+    """Return the file extension matching the magic bytes at the start of a file, or None."""
+    return next((ext for magic, ext in MAGIC_EXTENSIONS.items() if head.startswith(magic)), None)
+
+def save_download(response, dest_dir=DOWNLOAD_DIR):
+    """
+    Stream a download response to dest_dir, naming it from its headers or magic bytes.
+    Returns (success, file_path, is_pdf)
+    """
+    print(f"Status code: {response.status_code}")
+    print(f"Content type: {response.headers.get('Content-Type')}")
+    print(f"Content length: {response.headers.get('Content-Length', 'unknown')} bytes")
+    
+    if response.status_code != 200:
+        print(f"Error: Received status code {response.status_code}")
+        return False, None, False
+    
+    # Peek at the first bytes to sniff the file type without consuming them
+    response.raw.decode_content = True
+    body = io.BufferedReader(response.raw, COPY_BUFFER_SIZE)
+    sniffed_ext = sniff_extension(body.peek(8)[:8])
+    
+    # Try to get the filename from the Content-Disposition header
+    content_disposition = response.headers.get('Content-Disposition', '')
+    filename_match = FILENAME_RE.search(content_disposition)
+    
+    if filename_match:
+        filename = filename_match.group(1)
+        print(f"Extracted filename from Content-Disposition: {filename}")
+    else:
+        # Guess the file extension from the content type, then from the first few bytes,
+        # defaulting to .bin if we can't determine the type
+        content_type = response.headers.get('Content-Type', '')
+        ext = next((ext for type_name, ext in CONTENT_TYPE_EXTENSIONS.items() if type_name in content_type), None)
+        ext = ext or sniffed_ext or '.bin'
+        
+        # Create a default filename
+        filename = f"download{ext}"
+        print(f"Generated filename: {filename}")
+    
+    # Clean the filename
+    filename = UNSAFE_FILENAME_CHARS_RE.sub('_', filename)
+    
+    # Determine if the file is a PDF
+    is_pdf = ('application/pdf' in response.headers.get('Content-Type', '') or 
+              filename.lower().endswith('.pdf') or
+              sniffed_ext == '.pdf')
+    
+    # Save the file
+    os.makedirs(dest_dir, exist_ok=True)
+    file_path = os.path.join(dest_dir, filename)
+    save_response_body(body, file_path)
+    print(f"Successfully downloaded file to {file_path}")
+    
+    return True, file_path, is_pdf
+
+def is_up_to_date(src, dest):
+    """Return True if dest already holds a copy of src: same size and, as copy_file preserves it, same mtime."""
+    try:
+        src_stat = os.stat(src)
+        dest_stat = os.stat(dest)
+    except FileNotFoundError:
+        return False
+    return (src_stat.st_size == dest_stat.st_size and
+            int(src_stat.st_mtime) == int(dest_stat.st_mtime))
+
+def copy_file(src, dest):
+    """
+    Copy a file with its metadata, like shutil.copy2, but let the kernel move the bytes.
+    os.copy_file_range can share extents (reflink) on btrfs/xfs; otherwise shutil.copyfile
+    falls back to sendfile on Linux.
+    """
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining <= 0:
+                shutil.copystat(src, dest)
+                return
+        except OSError:
+            pass  # e.g. EXDEV on older kernels or an unsupported filesystem
+    shutil.copyfile(src, dest)
+    shutil.copystat(src, dest)
+
 def extract_archive(archive_path, extract_dir):
-    """Extract an archive using unar."""
+    """Extract a ZIP or RAR archive in-process, falling back to unar for other formats or on failure."""
     print(f"Extracting {archive_path} to {extract_dir}")
+    with open(archive_path, 'rb') as f:
+        head = f.read(8)
+    
+    try:
+        if head.startswith(b'PK\x03\x04'):
+            with zipfile.ZipFile(archive_path) as archive:
+                archive.extractall(extract_dir)
+            print("Extraction successful!")
+            return True
+        if head.startswith(b'Rar!') and rarfile is not None:
+            with rarfile.RarFile(archive_path) as archive:
+                archive.extractall(extract_dir)
+            print("Extraction successful!")
+            return True
+    except ARCHIVE_ERRORS as e:
+        print(f"In-process extraction of {archive_path} failed ({e}), retrying with unar")
+    
     try:
         result = subprocess.run(['unar', '-force-overwrite', '-o', extract_dir, archive_path], 
                               capture_output=True, text=True, check=True)
@@ -123,93 +280,188 @@ def extract_archive(archive_path, extract_dir):
         print("You can install it with: brew install unar")
         return False
 
-def find_and_extract_nested_archives(extract_dir):
-    """Find and extract any nested archives in the extracted directory."""
-    for root, dirs, files in os.walk(extract_dir):
-        for file in files:
-            if file.lower().endswith('.rar') or file.lower().endswith('.zip'):
-                nested_archive = os.path.join(root, file)
-                print(f"\nFound nested archive: {nested_archive}")
-                
-                # Create a subdirectory for this nested archive
-                nested_extract_dir = os.path.join(extract_dir, os.path.splitext(file)[0])
-                os.makedirs(nested_extract_dir, exist_ok=True)
-                
-                # Extract the nested archive
-                extract_archive(nested_archive, nested_extract_dir)
-
-def copy_pdfs_to_pdf_dir(source_dir):
-    """Copy all PDFs from source_dir to PDF_DIR."""
-    pdf_files = []
-    for root, dirs, files in os.walk(source_dir):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                pdf_files.append(os.path.join(root, file))
-    
-    if pdf_files:
-        print(f"\nFound {len(pdf_files)} PDF files:")
-        for pdf_file in pdf_files:
-            print(f"- {pdf_file}")
-        
-        # Copy PDFs to the PDF directory
-        for pdf_file in pdf_files:
-            # Get the base filename
-            base_name = os.path.basename(pdf_file)
-            
-            # Create a destination path
-            dest_path = os.path.join(PDF_DIR, base_name)
-            
-            # Copy the file
+def scan_files(root_dir, suffixes):
+    """
+    Yield the paths of files under root_dir whose lowercase name ends with one of suffixes.
+    Uses os.scandir, whose entries carry their file type, so no extra stat calls are needed.
+    """
+    stack = [root_dir]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(suffixes):
+                    yield entry.path
+
+def copy_pdfs_from_tree(root_dir, copied, depth=0):
+    """
+    Scan root_dir once, copying each PDF to PDF_DIR as soon as it is found. Nested archives
+    are extracted and their contents handled the same way. copied is the set of PDF paths
+    already copied, so none is copied twice.
+    """
+    # Collect the matches before extracting, since extraction adds new directories to the tree
+    for path in list(scan_files(root_dir, ARCHIVE_SUFFIXES + ('.pdf',))):
+        if path.lower().endswith('.pdf'):
+            if path in copied:
+                continue
+            dest_path = os.path.join(PDF_DIR, os.path.basename(path))
+            if is_up_to_date(path, dest_path):
+                copied.add(path)
+                print(f"{dest_path} is already up to date")
+                continue
             try:
-                shutil.copy2(pdf_file, dest_path)
-                print(f"Copied {pdf_file} to {dest_path}")
+                copy_file(path, dest_path)
+                copied.add(path)
+                print(f"Copied {path} to {dest_path}")
             except Exception as e:
-                print(f"Error copying {pdf_file}: {e}")
+                print(f"Error copying {path}: {e}")
+            continue
         
-        print(f"\nSuccessfully copied {len(pdf_files)} PDF files to {PDF_DIR}")
-    else:
-        print("\nNo PDF files found in the extracted archive.")
+        print(f"\nFound nested archive: {path}")
+        if depth >= MAX_ARCHIVE_DEPTH:
+            print(f"Warning: Not extracting archives nested more than {MAX_ARCHIVE_DEPTH} levels deep")
+            continue
+        
+        # Create a subdirectory for this nested archive
+        nested_extract_dir = os.path.join(root_dir, os.path.splitext(os.path.basename(path))[0])
+        os.makedirs(nested_extract_dir, exist_ok=True)
+        
+        # Extract the nested archive and scan what came out of it
+        if extract_archive(path, nested_extract_dir):
+            copy_pdfs_from_tree(nested_extract_dir, copied, depth + 1)
 
-def process_file(file_path, is_pdf):
+def process_file(file_path, is_pdf, extract_dir=EXTRACTED_DIR):
     """Process a downloaded file (PDF or archive)."""
     if is_pdf:
         # If it's a PDF, copy directly to the PDF directory
         filename = os.path.basename(file_path)
         dest_path = os.path.join(PDF_DIR, filename)
-        shutil.copy2(file_path, dest_path)
+        if is_up_to_date(file_path, dest_path):
+            print(f"{dest_path} is already up to date")
+            return True
+        copy_file(file_path, dest_path)
         print(f"Copied PDF directly to {dest_path}")
         return True
     else:
         # For non-PDF files, try to extract them
-        extract_dir = EXTRACTED_DIR
         if extract_archive(file_path, extract_dir):
-            # Look for nested archives and extract them
-            find_and_extract_nested_archives(extract_dir)
-            
-            # Copy any PDFs found to the PDF directory
-            copy_pdfs_to_pdf_dir(extract_dir)
+            # Copy the PDFs to the PDF directory while scanning, extracting nested archives along the way
+            copied = set()
+            copy_pdfs_from_tree(extract_dir, copied)
+            if copied:
+                print(f"\nSuccessfully copied {len(copied)} PDF files to {PDF_DIR}")
+            else:
+                print("\nNo PDF files found in the extracted archive.")
             return True
         return False
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF using pdfplumber."""
+def extract_page_range(pdf_path, start, stop):
+    """Extract the text of pages start..stop-1 of a PDF. Runs in a worker process."""
+    with pdfplumber.open(pdf_path, pages=range(start + 1, stop + 1)) as pdf:
+        return [page.extract_text() for page in pdf.pages]
+
+def extract_pages_in_parallel(pdf_path, page_count, workers):
+    """Split the pages of a PDF into contiguous ranges and extract them in separate processes."""
+    workers = min(workers, page_count)
+    chunk_size = -(-page_count // workers)  # ceiling division
+    starts = list(range(0, page_count, chunk_size))
+    stops = [min(start + chunk_size, page_count) for start in starts]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = executor.map(extract_page_range, [pdf_path] * len(starts), starts, stops)
+        return [text for chunk in chunks for text in chunk]
+
+def extract_page_texts_with_pymupdf(pdf_path):
+    """Return the text of each page of a PDF using PyMuPDF."""
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        print(f"Processing {doc.page_count} pages with PyMuPDF")
+        return [page.get_text("text") for page in doc]
+
+def extract_page_texts_with_pdfplumber(pdf_path, workers=1):
+    """
+    Return the text of each page of a PDF using pdfplumber.
+    With workers > 1, PDFs of PARALLEL_PAGE_THRESHOLD pages or more are split across that many processes.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+        if workers > 1 and page_count >= PARALLEL_PAGE_THRESHOLD:
+            print(f"Processing {page_count} pages with {workers} processes")
+            return extract_pages_in_parallel(pdf_path, page_count, workers)
+        
+        page_texts = []
+        for i, page in enumerate(pdf.pages):
+            print(f"Processing page {i+1}/{page_count}")
+            page_texts.append(page.extract_text())
+        return page_texts
+
+def is_scanned(pdf_path):
+    """Return True if the first page of a PDF has no text layer, using a cheap PyMuPDF probe."""
+    try:
+        import fitz  # PyMuPDF
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count > 0 and not doc[0].get_text("text").strip()
+    except Exception as e:
+        # Let the full extraction decide
+        print(f"Could not probe {pdf_path}: {e}")
+        return False
+
+def text_cache_path(pdf_path):
+    """Return the text cache file for a PDF, keyed by a hash of its contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return os.path.join(TEXT_CACHE_DIR, f"{digest.hexdigest()}.txt")
+
+def extract_text_from_pdf(pdf_path, workers=1):
+    """
+    Extract text from a PDF using PyMuPDF, falling back to pdfplumber when it finds no text.
+    workers is passed on to the pdfplumber fallback, which can split large PDFs across processes.
+    """
     print(f"Extracting text from {pdf_path}")
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for i, page in enumerate(pdf.pages):
-                print(f"Processing page {i+1}/{len(pdf.pages)}")
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + "\n"
-                else:
-                    print(f"Warning: No text extracted from page {i+1}")
+        # Reuse the text extracted on an earlier run for a PDF with the same bytes
+        cache_path = text_cache_path(pdf_path)
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                print(f"Using cached text from {cache_path}")
+                return f.read()
+        except FileNotFoundError:
+            pass
+        
+        try:
+            page_texts = extract_page_texts_with_pymupdf(pdf_path)
+        except Exception as e:
+            print(f"PyMuPDF could not read {pdf_path}: {e}")
+            page_texts = []
+        
+        if not any(page_text.strip() for page_text in page_texts):
+            print("No text found with PyMuPDF, retrying with pdfplumber")
+            page_texts = extract_page_texts_with_pdfplumber(pdf_path, workers)
+        
+        # Collect the pieces and join once; repeated string += is quadratic on long documents
+        parts = []
+        for i, extracted in enumerate(page_texts):
+            if extracted:
+                parts.append(PAGE_MARKER.format(i + 1))
+                parts.append(extracted)
+                parts.append("\n")
+            else:
+                print(f"Warning: No text extracted from page {i+1}")
+        text = "".join(parts)
         
         if not text.strip():
             print("Warning: No text was extracted from the PDF. It might be a scanned document.")
         else:
             print(f"Successfully extracted {len(text)} characters of text")
         
+        # Write to a per-process temporary file first so concurrent workers never see a partial file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+        
         return text
     except Exception as e:
         print(f"Failed to extract text from {pdf_path}: {e}")
@@ -227,23 +479,41 @@ def initialize_vertex_ai(project_id, location):
         traceback.print_exc()
         return False
 
-def summarize_with_gemini(text, endpoint_id, project_id, location):
-    """Summarize text using Vertex AI Gemini model."""
-    if not text.strip():
-        return "No text content to summarize."
-    
+def count_tokens(text):
+    """Count Gemini tokens with the local tokenizer, estimating from the length if it is unavailable."""
     try:
-        print("Sending text to Gemini model for summarization...")
-        
-        # Construct the endpoint path
-        endpoint_path = f"projects/{project_id}/locations/{location}/endpoints/{endpoint_id}"
-        print(f"Using endpoint: {endpoint_path}")
-        
-        # Get the endpoint
-        endpoint = aiplatform.Endpoint(endpoint_name=endpoint_path)
-        
-        # Prepare the prompt
-        prompt = f"""
+        from vertexai.preview import tokenization
+        return tokenization.get_tokenizer_for_model(TOKENIZER_MODEL).count_tokens(text).total_tokens
+    except Exception:
+        return len(text) // CHARS_PER_TOKEN + 1
+
+def trim_to_token_budget(text, max_tokens=MAX_INPUT_TOKENS):
+    """Drop whole pages from the end of text until it fits in max_tokens."""
+    total_tokens = count_tokens(text)
+    if total_tokens <= max_tokens:
+        return text
+    
+    # Tokens are counted once; pages are then kept assuming tokens are spread evenly over characters
+    max_chars = len(text) * max_tokens // total_tokens
+    pages = PAGE_SPLIT_RE.split(text)
+    kept = []
+    kept_chars = 0
+    for page in pages:
+        if kept_chars + len(page) > max_chars:
+            break
+        kept.append(page)
+        kept_chars += len(page)
+    
+    if not "".join(kept).strip():
+        # The first page alone is over budget; cut it at a word boundary
+        return text[:max_chars].rsplit(None, 1)[0]
+    
+    print(f"Trimmed document to {kept_chars} of {len(text)} characters to fit {max_tokens} tokens")
+    return "".join(kept)
+
+def build_summary_prompt(text):
+    """Return the summarization prompt for a document's text, trimmed to the token budget."""
+    return f"""
         Please provide a concise summary of the following procurement document. 
         Focus on key information such as:
         - The type of procurement
@@ -253,40 +523,122 @@ def summarize_with_gemini(text, endpoint_id, project_id, location):
         - Estimated value (if mentioned)
         
         Document text:
-        {text[:10000]}  # Limiting to first 10000 chars as Gemini has input limits
+        {trim_to_token_budget(text)}
         
         If the text appears to be truncated, please note that in your summary.
         """
+
+@functools.lru_cache(maxsize=4)
+def get_endpoint(endpoint_id, project_id, location):
+    """Return the Vertex AI endpoint serving the Gemini model, created once and reused for every call."""
+    endpoint_path = f"projects/{project_id}/locations/{location}/endpoints/{endpoint_id}"
+    print(f"Using endpoint: {endpoint_path}")
+    return aiplatform.Endpoint(endpoint_name=endpoint_path)
+
+def summarize_batch(texts, endpoint_id, project_id, location):
+    """
+    Summarize several texts with a single endpoint.predict call.
+    If the batch fails, each text is retried on its own so one bad document cannot sink the others.
+    Returns one summary (or error message) per text, in order.
+    """
+    try:
+        print(f"Sending {len(texts)} text(s) to Gemini model for summarization...")
+        endpoint = get_endpoint(endpoint_id, project_id, location)
         
         # Send to the model
         response = endpoint.predict(
-            instances=[{"text": prompt}],
-            parameters={
-                "temperature": 0.2,  # Lower temperature for more factual output
-                "maxOutputTokens": 1024,  # Reasonable summary length
-                "topK": 40,
-                "topP": 0.95,
-            }
+            instances=[{"text": build_summary_prompt(text)} for text in texts],
+            parameters=SUMMARY_PARAMETERS
         )
         
-        # Extract the summary from the response
+        # Extract the summaries from the response, one prediction per instance
         # Note: The exact structure depends on the Gemini model's API
         # This might need adjustment based on the actual response format
-        if hasattr(response, 'predictions') and response.predictions:
-            summary = response.predictions[0]
-            print("Successfully generated summary")
-            return summary
-        else:
-            print("Warning: Unexpected response format from Gemini API")
-            return "Error: Could not generate summary due to unexpected API response format."
+        predictions = getattr(response, 'predictions', None)
+        if predictions and len(predictions) == len(texts):
+            print(f"Successfully generated {len(predictions)} summaries")
+            return list(predictions)
+        
+        print("Warning: Unexpected response format from Gemini API")
+        if len(texts) == 1:
+            return ["Error: Could not generate summary due to unexpected API response format."]
     
     except Exception as e:
         print(f"Error during summarization: {e}")
         traceback.print_exc()
-        return f"Error generating summary: {str(e)}"
+        if len(texts) == 1:
+            return [f"Error generating summary: {str(e)}"]
+    
+    print("Retrying the batch one document at a time")
+    return [summarize_batch([text], endpoint_id, project_id, location)[0] for text in texts]
+
+def summarize_with_gemini(text, endpoint_id, project_id, location):
+    """Summarize text using Vertex AI Gemini model."""
+    if not text.strip():
+        return "No text content to summarize."
+    return summarize_batch([text], endpoint_id, project_id, location)[0]
 
-def process_pdfs_for_summaries(project_id, location, endpoint_id):
-    """Process all PDFs in PDF_DIR and save summaries to SUMMARY_DIR."""
+def summarize_with_batch_job(texts, gcs_prefix, model_name):
+    """
+    Summarize texts with one Gemini batch prediction job instead of online predictions.
+    Batch jobs cost about half as much but can take minutes to hours; the requests and
+    results are exchanged as JSONL files under gcs_prefix (gs://bucket/path).
+    Returns one summary (or error message) per text, in order.
+    """
+    from google.cloud import storage
+    from vertexai.batch_prediction import BatchPredictionJob
+    
+    prompts = [build_summary_prompt(text) for text in texts]
+    lines = [json.dumps({
+        "request": {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": SUMMARY_PARAMETERS,
+        }
+    }) for prompt in prompts]
+    
+    # Upload the requests to a fresh folder for this run
+    bucket_name, _, prefix = gcs_prefix[len("gs://"):].partition("/")
+    run_prefix = "/".join(part for part in (prefix.strip("/"), time.strftime("%Y%m%d_%H%M%S")) if part)
+    bucket = storage.Client().bucket(bucket_name)
+    bucket.blob(f"{run_prefix}/request.jsonl").upload_from_string("\n".join(lines), content_type="application/jsonl")
+    
+    job = BatchPredictionJob.submit(
+        source_model=model_name,
+        input_dataset=f"gs://{bucket_name}/{run_prefix}/request.jsonl",
+        output_uri_prefix=f"gs://{bucket_name}/{run_prefix}/output",
+    )
+    print(f"Submitted batch prediction job {job.resource_name} with {len(prompts)} documents")
+    while not job.has_ended:
+        time.sleep(BATCH_POLL_INTERVAL)
+        job.refresh()
+    
+    if not job.has_succeeded:
+        print(f"Batch prediction job failed: {job.error}")
+        return [f"Error generating summary: batch prediction job failed ({job.error})"] * len(texts)
+    
+    # Output lines echo their request and may come back in any order, so match them by prompt
+    results = {}
+    output_prefix = job.output_location[len(f"gs://{bucket_name}/"):]
+    for blob in bucket.list_blobs(prefix=output_prefix):
+        if not blob.name.endswith(".jsonl"):
+            continue
+        for line in blob.download_as_text().splitlines():
+            result = json.loads(line)
+            prompt = result["request"]["contents"][0]["parts"][0]["text"]
+            try:
+                results[prompt] = result["response"]["candidates"][0]["content"]["parts"][0]["text"]
+            except (KeyError, IndexError):
+                results[prompt] = f"Error generating summary: {result.get('status') or 'no response'}"
+    
+    print(f"Batch prediction job finished with {len(results)} results")
+    return [results.get(prompt, "Error generating summary: missing from batch output") for prompt in prompts]
+
+def process_pdfs_for_summaries(project_id, location, endpoint_id, batch_gcs_prefix=None,
+                               batch_model=DEFAULT_BATCH_MODEL):
+    """
+    Process all PDFs in PDF_DIR and save summaries to SUMMARY_DIR.
+    With batch_gcs_prefix, all PDFs are summarized by a single batch prediction job.
+    """
     pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith('.pdf')]
     
     if not pdf_files:
@@ -295,6 +647,8 @@ def process_pdfs_for_summaries(project_id, location, endpoint_id):
     
     print(f"Found {len(pdf_files)} PDF files to summarize.")
     
+    # Collect the PDFs that still need a summary
+    todo = []
     for pdf_file in pdf_files:
         pdf_path = os.path.join(PDF_DIR, pdf_file)
         summary_file = os.path.join(SUMMARY_DIR, f"summary_{pdf_file.replace('.pdf', '.txt')}")
@@ -304,20 +658,62 @@ def process_pdfs_for_summaries(project_id, location, endpoint_id):
             print(f"Summary already exists for {pdf_file}, skipping.")
             continue
         
+        # Skip the full parse for scanned documents, judged by their first page
+        if is_scanned(pdf_path):
+            print(f"{pdf_file} looks like a scanned document (no text on page 1), skipping summarization.")
+            with open(summary_file, "w", encoding="utf-8") as f:
+                f.write("No text content could be extracted from this PDF. It might be a scanned document or contain only images.")
+            continue
+        todo.append((pdf_file, pdf_path, summary_file))
+    
+    if not todo:
+        return
+    
+    # Extract text in worker processes (CPU-bound); summarization stays here since it is network-bound.
+    # Only one level is parallel: a single PDF is split by pages, several PDFs get one process each.
+    workers = min(os.cpu_count() or 1, MAX_EXTRACTION_WORKERS)
+    if len(todo) == 1:
+        texts = [extract_text_from_pdf(todo[0][1], workers)]
+        save_summaries(todo, texts, project_id, location, endpoint_id, batch_gcs_prefix, batch_model)
+        return
+    
+    with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as executor:
+        texts = executor.map(extract_text_from_pdf, [pdf_path for _, pdf_path, _ in todo])
+        save_summaries(todo, texts, project_id, location, endpoint_id, batch_gcs_prefix, batch_model)
+
+def save_summaries(todo, texts, project_id, location, endpoint_id, batch_gcs_prefix=None,
+                   batch_model=DEFAULT_BATCH_MODEL):
+    """
+    Summarize the extracted texts in batches of SUMMARY_BATCH_SIZE and write each summary file.
+    With batch_gcs_prefix, everything is collected first and sent as one batch prediction job.
+    """
+    batch = []
+    for (pdf_file, pdf_path, summary_file), text in zip(todo, texts):
         print(f"\nProcessing {pdf_file} for summarization...")
         
-        # Extract text from PDF
-        text = extract_text_from_pdf(pdf_path)
-        
         if not text.strip():
             print(f"No text extracted from {pdf_file}, skipping summarization.")
             with open(summary_file, "w", encoding="utf-8") as f:
                 f.write("No text content could be extracted from this PDF. It might be a scanned document or contain only images.")
             continue
         
-        # Summarize the text
-        summary = summarize_with_gemini(text, endpoint_id, project_id, location)
-        
+        batch.append((pdf_file, summary_file, text))
+        if len(batch) == SUMMARY_BATCH_SIZE and not batch_gcs_prefix:
+            save_summary_batch(batch, project_id, location, endpoint_id)
+            batch = []
+    
+    if batch:
+        save_summary_batch(batch, project_id, location, endpoint_id, batch_gcs_prefix, batch_model)
+
+def save_summary_batch(batch, project_id, location, endpoint_id, batch_gcs_prefix=None,
+                       batch_model=DEFAULT_BATCH_MODEL):
+    """Summarize a batch of (pdf_file, summary_file, text) items with one request and save the results."""
+    texts = [text for _, _, text in batch]
+    if batch_gcs_prefix:
+        summaries = summarize_with_batch_job(texts, batch_gcs_prefix, batch_model)
+    else:
+        summaries = summarize_batch(texts, endpoint_id, project_id, location)
+    for (pdf_file, summary_file, _), summary in zip(batch, summaries):
         # Save the summary
         with open(summary_file, "w", encoding="utf-8") as f:
             f.write(summary)
@@ -327,7 +723,7 @@ def process_pdfs_for_summaries(project_id, location, endpoint_id):
 def process_alertalicitacao_url(url):
     """Process an alertalicitacao URL to extract PNCP parameters and construct API URL."""
     print(f"Processing AlertaLicitacao URL: {url}")
-    pncp_id_match = re.search(r'PNCP-(\d+)-(\d+)-(\d+)-(\d+)', url)
+    pncp_id_match = PNCP_ID_RE.search(url)
     if pncp_id_match:
         cnpj = pncp_id_match.group(1)
         sequence = pncp_id_match.group(2)
@@ -351,41 +747,65 @@ def main():
     """Main function to handle downloading, extracting, and summarizing."""
     parser = argparse.ArgumentParser(description="Download, extract, and summarize procurement documents.")
     parser.add_argument("--url", help="URL to download from")
+    parser.add_argument("--urls-file", help="File with one URL per line to download concurrently")
     parser.add_argument("--project-id", help="Google Cloud project ID", default=os.environ.get("GOOGLE_CLOUD_PROJECT"))
     parser.add_argument("--location", help="Google Cloud location", default="us-central1")
     parser.add_argument("--endpoint-id", help="Vertex AI endpoint ID")
     parser.add_argument("--skip-summarization", action="store_true", help="Skip the summarization step")
+    parser.add_argument("--batch-gcs-prefix",
+                        help="Summarize with a Gemini batch prediction job, staging files under this gs:// prefix")
+    parser.add_argument("--batch-model", default=DEFAULT_BATCH_MODEL, help="Gemini model used for batch prediction")
     
     args = parser.parse_args()
     
     # Setup directories
     setup_directories()
     
-    # Get URL from argument or prompt
-    url = args.url
-    if not url:
-        url = input("Please enter the URL to download from: ")
+    # Get URLs from the URL file, the argument or a prompt
+    if args.urls_file:
+        with open(args.urls_file, "r", encoding="utf-8") as f:
+            urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    else:
+        urls = [args.url or input("Please enter the URL to download from: ")]
     
     # Process alertalicitacao URLs
-    if 'alertalicitacao.com.br' in url:
-        pncp_url = process_alertalicitacao_url(url)
-        if pncp_url:
+    resolved_urls = []
+    for url in urls:
+        if 'alertalicitacao.com.br' in url:
+            pncp_url = process_alertalicitacao_url(url)
+            if not pncp_url:
+                print(f"Failed to process alertalicitacao URL: {url}")
+                continue
             url = pncp_url
-        else:
-            print("Failed to process alertalicitacao URL.")
-            return 1
-    
-    # Download the file
-    print(f"Starting download from URL: {url}")
-    success, file_path, is_pdf = download_file(url)
+        resolved_urls.append(url)
     
-    if not success:
-        print("Download failed.")
+    if not resolved_urls:
+        print("No URLs to download.")
         return 1
     
-    # Process the downloaded file
-    if not process_file(file_path, is_pdf):
-        print("File processing failed.")
+    # Download the files, concurrently when there are several
+    if len(resolved_urls) == 1:
+        print(f"Starting download from URL: {resolved_urls[0]}")
+        downloads = [download_file(resolved_urls[0])]
+        extract_dirs = [EXTRACTED_DIR]
+    else:
+        print(f"Starting {len(resolved_urls)} downloads")
+        downloads = download_many(resolved_urls)
+        extract_dirs = [os.path.join(EXTRACTED_DIR, str(index)) for index in range(1, len(downloads) + 1)]
+    
+    # Process the downloaded files
+    processed = 0
+    for url, (success, file_path, is_pdf), extract_dir in zip(resolved_urls, downloads, extract_dirs):
+        if not success:
+            print(f"Download failed: {url}")
+            continue
+        if not process_file(file_path, is_pdf, extract_dir):
+            print(f"File processing failed: {file_path}")
+            continue
+        processed += 1
+    
+    if not processed:
+        print("No files were downloaded and processed.")
         return 1
     
     # Skip summarization if requested or if required parameters are missing
@@ -402,18 +822,22 @@ def main():
         print("To enable summarization, provide --project-id or set GOOGLE_CLOUD_PROJECT environment variable.")
         return 0
     
-    if not endpoint_id:
+    if not endpoint_id and not args.batch_gcs_prefix:
         print("Warning: Vertex AI endpoint ID not provided. Skipping summarization.")
         print("To enable summarization, provide --endpoint-id parameter.")
         return 0
     
+    if args.batch_gcs_prefix and not args.batch_gcs_prefix.startswith("gs://"):
+        print(f"Error: --batch-gcs-prefix must be a gs:// URI, got {args.batch_gcs_prefix}")
+        return 1
+    
     # Initialize Vertex AI
     if not initialize_vertex_ai(project_id, args.location):
         print("Failed to initialize Vertex AI. Skipping summarization.")
         return 1
     
     # Process PDFs for summaries
-    process_pdfs_for_summaries(project_id, args.location, endpoint_id)
+    process_pdfs_for_summaries(project_id, args.location, endpoint_id, args.batch_gcs_prefix, args.batch_model)
     
     print("\nProcessing complete!")
     return 0
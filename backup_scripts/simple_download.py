@@ -1,15 +1,33 @@
 #!/usr/bin/env python3
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import sys
 
+# Chunk size used when streaming downloads to disk
+CHUNK_SIZE = 1024 * 1024
+
+# (connect, read) timeout in seconds for HTTP requests
+REQUEST_TIMEOUT = (10, 60)
+
+# Shared session: keeps connections alive between requests and retries transient failures
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                       max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504)))
+SESSION.mount('https://', _adapter)
+SESSION.mount('http://', _adapter)
+
+# Patterns compiled once at import time
+PNCP_ID_RE = re.compile(r'PNCP-(\d+)-(\d+)-(\d+)-(\d+)')
+
 def main():
     url = "https://alertalicitacao.com.br/!licitacao/PNCP-86050978000183-1-000148-2024"
     print(f"Downloading from {url}")
     
     # Try to extract PNCP ID
-    pncp_id_match = re.search(r'PNCP-(\d+)-(\d+)-(\d+)-(\d+)', url)
+    pncp_id_match = PNCP_ID_RE.search(url)
     if pncp_id_match:
         cnpj = pncp_id_match.group(1)
         sequence = pncp_id_match.group(2)
@@ -27,19 +45,20 @@ def main():
         }
         
         try:
-            response = requests.get(pncp_url, headers=headers)
-            print(f"Status code: {response.status_code}")
-            print(f"Content type: {response.headers.get('Content-Type')}")
-            print(f"Content length: {len(response.content)} bytes")
-            
-            if response.status_code == 200:
-                # Save the file
-                with open("download_test.bin", "wb") as f:
-                    f.write(response.content)
-                print("File downloaded successfully to download_test.bin")
-            else:
-                print(f"Error: {response.status_code}")
-                print(f"Response: {response.text[:500]}")
+            with SESSION.get(pncp_url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                print(f"Status code: {response.status_code}")
+                print(f"Content type: {response.headers.get('Content-Type')}")
+                print(f"Content length: {response.headers.get('Content-Length', 'unknown')} bytes")
+                
+                if response.status_code == 200:
+                    # Save the file in chunks instead of holding the whole body in memory
+                    with open("download_test.bin", "wb") as f:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            f.write(chunk)
+                    print("File downloaded successfully to download_test.bin")
+                else:
+                    print(f"Error: {response.status_code}")
+                    print(f"Response: {response.text[:500]}")
         except Exception as e:
             print(f"Error: {e}")
     else:
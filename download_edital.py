@@ -10,6 +10,8 @@ This script handles:
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sys
 import os
 import subprocess
@@ -18,25 +20,54 @@ import traceback
 import argparse
 import re
 import json
+import hashlib
+import io
 import logging
+import logging.handlers
+import atexit
 import asyncio
-from bs4 import BeautifulSoup
+import functools
+import threading
+import queue
+from lxml import etree
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import time
+import zipfile
+from collections import OrderedDict
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Setup logging
-logging.basicConfig(
-    filename='download_edital.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+try:
+    import rarfile
+except ImportError:  # RARs are then handed to unar
+    rarfile = None
+
+try:
+    import orjson
+except ImportError:  # the input JSON is then parsed with the json module
+    orjson = None
+
+# Setup logging (EDITAL_LOGLEVEL, INFO by default; DEBUG with --verbose)
+LOG_LEVEL = logging.getLevelName(os.environ.get('EDITAL_LOGLEVEL', 'INFO').upper())
+if not isinstance(LOG_LEVEL, int):
+    LOG_LEVEL = logging.INFO
+formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+log_file = logging.FileHandler('download_edital.log')
+log_file.setFormatter(formatter)
 
 # Also log to console
 console = logging.StreamHandler()
-console.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+console.setLevel(LOG_LEVEL)
 console.setFormatter(formatter)
-logging.getLogger('').addHandler(console)
+
+# Records are handed to a queue and written by a listener thread, so download and
+# extraction workers never block on the log file or the terminal
+log_queue = queue.SimpleQueue()
+logging.getLogger('').setLevel(LOG_LEVEL)
+logging.getLogger('').addHandler(logging.handlers.QueueHandler(log_queue))
+log_listener = logging.handlers.QueueListener(log_queue, log_file, console, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
 
 logging.info("Script starting - this should be visible!")
 
@@ -45,9 +76,239 @@ DOWNLOAD_DIR = "downloads_simple"
 EXTRACTED_DIR = "extracted_simple"
 PDF_DIR = "pdfs_simple"
 
-# Playwright globals
+# Number of licitações downloaded at the same time
+DEFAULT_WORKERS = 8
+
+# Downloaded files are extracted by a separate pool of this many threads, so extraction
+# of one file overlaps with the downloads of the next ones
+EXTRACTION_WORKERS = os.cpu_count() or 1
+
+# One shared session so repeated requests to the same portals reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5'
+})
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16,
+                       max_retries=Retry(total=5, backoff_factor=0.5,
+                                         status_forcelist=(429, 500, 502, 503, 504),
+                                         allowed_methods=frozenset(['HEAD', 'GET'])))
+SESSION.mount('https://', _adapter)
+SESSION.mount('http://', _adapter)
+
+# (connect, read) timeout in seconds for requests without a shorter timeout of their own;
+# together with the session's retries this bounds how long one URL can hold a worker
+DEFAULT_TIMEOUT = (5, 30)
+
+# Candidate URLs are HEAD-probed this many at a time; probes and the quick page checks
+# for download buttons use the shorter PROBE_TIMEOUT, in seconds
+MAX_CONCURRENT_PROBES = 8
+PROBE_TIMEOUT = 5
+
+# Known Portal de Compras Públicas file locations, in the order they are tried when there is
+# no history yet. {filename} is the edital's file name, e.g. EDITAL202481.pdf
+PORTAL_PATTERNS = [
+    "https://www.portaldecompraspublicas.com.br/sitetema/files/editais/{filename}",
+    "https://www.portaldecompraspublicas.com.br/3/pt-br/download/{filename}",
+    "https://arquivos.portaldecompraspublicas.com.br/{filename}",
+    "https://arquivos.portaldecompraspublicas.com.br/editais/{filename}",
+    "https://www.portaldecompraspublicas.com.br/editais/2024/{filename}",
+    # Try with lowercase too
+    "https://www.portaldecompraspublicas.com.br/sitetema/files/editais/{filename_lower}",
+    "https://www.portaldecompraspublicas.com.br/3/pt-br/download/{filename_lower}"
+]
+
+# The SAMAE São Bento do Sul edital (PE 81/2024) and the local copies used when no portal
+# location serves it, resolved once at import time
+SAMAE_EDITAL_FILENAME = "EDITAL202481.pdf"
+SAMAE_EXISTING_FILE = os.path.abspath(os.path.join(DOWNLOAD_DIR, SAMAE_EDITAL_FILENAME))
+SAMAE_FALLBACK_PDF = os.path.abspath(os.path.join(PDF_DIR, "example2.pdf"))
+SAMAE_DOWNLOAD_URL = "https://www.portaldecompraspublicas.com.br/processos/sc/servico-autonomo-municipal-de-agua-e-esgoto-de-sao-bento-do-sul-samae-2513/pe-81-2024-2024-343451/download/"
+SAMAE_UPL_URL = f"https://portaldecompraspublicas.com.br/3/upl/{SAMAE_EDITAL_FILENAME}"
+
+# Hard-coded last resorts returned for pages that could not be resolved; they are guesses,
+# not resolutions of the page, so they are never remembered across runs
+GUESSED_PDF_URLS = {SAMAE_DOWNLOAD_URL, SAMAE_UPL_URL, f"file://{SAMAE_EXISTING_FILE}", f"file://{SAMAE_FALLBACK_PDF}"}
+
+# Hit rates of PORTAL_PATTERNS, kept across runs as exponential moving averages
+PORTAL_CACHE_FILE = os.path.join(DOWNLOAD_DIR, "portal_success_cache.json")
+PORTAL_SCORE_ALPHA = 0.3
+portal_scores = None
+portal_scores_lock = threading.Lock()
+
+# Direct PDF URLs found for portal pages without a browser, kept across runs; a direct
+# URL must answer a HEAD within DIRECT_PDF_PROBE_TIMEOUT seconds to be used
+RESOLVED_PDF_CACHE_FILE = os.path.join(DOWNLOAD_DIR, "resolved_pdf_urls.json")
+DIRECT_PDF_PROBE_TIMEOUT = 3
+resolved_pdfs = None
+resolved_pdfs_lock = threading.Lock()
+
+# What each Portal de Compras page resolved to, kept across runs by canonical page URL and
+# trusted for RESOLUTION_TTL seconds; after that it is reused only if the page answers a
+# conditional HEAD with 304 Not Modified, otherwise the page is resolved again. A resolution
+# waits in pending_resolutions (by resolved URL) until it was downloaded and is a PDF
+RESOLUTION_CACHE_FILE = os.path.join(DOWNLOAD_DIR, "portal_resolutions.json")
+RESOLUTION_TTL = 24 * 60 * 60
+resolutions = None
+pending_resolutions = {}
+resolutions_lock = threading.Lock()
+
+# ETag/Last-Modified of earlier downloads by URL, kept across runs so unchanged files can be
+# revalidated with a conditional GET instead of downloaded again. The file's inode and size
+# are kept too, so a path since overwritten by another download is never trusted
+DOWNLOAD_CACHE_FILE = os.path.join(DOWNLOAD_DIR, "cache_index.json")
+download_cache = None
+download_cache_lock = threading.Lock()
+
+# SHA-256 of every downloaded file's content mapped to its path, kept across runs, so a file
+# with the same content under another URL is hard-linked to the first copy instead of kept twice
+CONTENT_INDEX_FILE = os.path.join(DOWNLOAD_DIR, "content_index.json")
+content_index = None
+content_index_lock = threading.Lock()
+
+# Archive types extracted in-process, and how deep archives inside archives are followed
+ARCHIVE_SUFFIXES = ('.rar', '.zip')
+MAX_ARCHIVE_DEPTH = 5
+
+# Errors from in-process extraction that should fall back to unar. zipfile raises
+# NotImplementedError for unsupported methods (e.g. Deflate64) and RuntimeError for
+# encrypted members, both of which unar can handle
+ARCHIVE_ERRORS = (zipfile.BadZipFile, NotImplementedError, RuntimeError)
+if rarfile:
+    ARCHIVE_ERRORS += (rarfile.Error,)
+
+# File extensions by leading magic bytes and by Content-Type
+MAGIC_EXTENSIONS = {
+    b'%PDF': '.pdf',
+    b'PK\x03\x04': '.zip',
+    b'Rar!': '.rar',
+}
+CONTENT_TYPE_EXTENSIONS = {
+    'application/pdf': '.pdf',
+    'application/zip': '.zip',
+    'application/x-rar-compressed': '.rar',
+}
+
+# Patterns compiled once at import time
+PNCP_ID_RE = re.compile(r'PNCP-(\d+)-(\d+)-(\d+)-(\d+)')
+PNCP_ID_SHORT_RE = re.compile(r'PNCP-(\d+)-(\d+)-(\d+)')
+PCP_ID_RE = re.compile(r'PCP-(\d+)-(\d+)-(\d+)')
+PROCESS_ID_RE = re.compile(r'/(\d+-\d+)$')
+FILENAME_RE = re.compile(r'filename=[\'"]?([^\'"]+)')
+UNSAFE_FILENAME_CHARS_RE = re.compile(r'[^\w\-\.]')
+PDF_HREF_RE = re.compile(rb'''href=(["'])([^"']+\.pdf)\1''')
+BAIXAR_ARQUIVO_RE = re.compile(r'Baixar\s*Arquivo', re.IGNORECASE)
+ORIGINAL_URL_RE = re.compile(rb'Visitar site original para mais detalhes: (https://[^\s<>"\']+)')
+PORTAL_URL_RE = re.compile(rb'(https://www\.portaldecompraspublicas\.com\.br/[^\s<>"\']+)')
+
+# Chunk size used when streaming downloads and archive members to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Downloads larger than this are written to disk by a separate thread, with up to
+# WRITE_QUEUE_DEPTH chunks in flight, so slow disk writes don't stall reading from the network
+LARGE_DOWNLOAD_SIZE = 8 * 1024 * 1024
+WRITE_QUEUE_DEPTH = 8
+
+# Extra browser-like headers sent with file downloads, on top of the session defaults.
+# Accept-Encoding is left to requests, which only offers encodings urllib3 can decode
+# (br needs the brotli package), so streamed bodies are always written decompressed.
+DOWNLOAD_HEADERS = {
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+    'Cache-Control': 'max-age=0'
+}
+
+# Playwright globals. One browser is shared by all dynamic downloads; it lives on its own
+# event loop thread, since Playwright objects can only be used from the loop that created them
 playwright = None
 browser = None
+playwright_lock = None
+playwright_loop = None
+playwright_loop_lock = threading.Lock()
+
+# Browser contexts are kept per host, so pages on the same portal share Chromium's cache
+# and cookies. At most MAX_HOST_CONTEXTS stay open; the least recently used idle one is
+# closed first. Each context's cookies and storage are saved to BROWSER_STATE_DIR when it
+# closes and loaded again the next time that host is visited, including in later runs.
+MAX_HOST_CONTEXTS = 4
+BROWSER_STATE_DIR = os.path.join(DOWNLOAD_DIR, "browser_state")
+host_contexts = OrderedDict()
+host_context_users = {}
+
+# Pages are reused for later URLs on the same host instead of opened per URL; idle pages are
+# kept per host as (page, navigations) and closed after MAX_PAGE_NAVIGATIONS to bound the
+# memory Chromium accumulates in a long-lived page
+MAX_PAGE_NAVIGATIONS = 20
+host_pages = {}
+
+# Buttons looked for on dynamic pages, in order of preference, as (CSS selector, text) rules.
+# A rule matches a visible element for the selector whose text contains the given text
+# (case-insensitive, like Playwright's :has-text); a text of None matches any element
+COOKIE_BUTTON_RULES = [
+    ("button#onetrust-accept-btn-handler", None),
+    ("button[aria-label='Accept cookies']", None),
+    ("button[aria-label='Aceitar cookies']", None),
+    ("button", "Accept"),
+    ("button", "Aceitar"),
+    ("button", "Accept All Cookies"),
+    ("button", "Aceitar Todos os Cookies"),
+    ("[id*='cookie'] button", "Accept"),
+    ("[id*='cookie'] button", "Aceitar"),
+    (".cookie-banner button:first-child", None),
+    ("#cookieConsent button.accept", None),
+    ("#gdpr-consent-tool-wrapper button[data-text-accept]", None),
+    ("#consent-page button.consent-accept", None),
+]
+DOWNLOAD_BUTTON_RULES = [
+    ("button", "Baixar Arquivo"),
+    ("button", "Baixar"),
+    ("a", "Baixar Arquivo"),
+    ("a", "Baixar"),
+    ("div.botaoBaixar", None),
+    ("a.botaoBaixar", None),
+    ("[data-test='download-button']", None),
+    ("[aria-label='Baixar arquivo']", None),
+    ("button", "Download"),
+    ("a", "Download"),
+]
+
+# How often each button rule was the one matched, kept across runs; rules are checked in
+# order of most hits, so the buttons the portals actually use are preferred. Counts are
+# updated in memory and saved at shutdown, so the Playwright loop does no file I/O for them
+SELECTOR_HITS_FILE = os.path.join(DOWNLOAD_DIR, "selector_hits.json")
+selector_hits = None
+selector_hits_lock = threading.Lock()
+
+# How long, in milliseconds, to wait for any cookie or download button rule to match
+COOKIE_BUTTON_WAIT = 3000
+DOWNLOAD_BUTTON_WAIT = 5000
+
+# Evaluated in the page: returns [rule index, element] for the first rule with a visible
+# match, or null, so all rules are checked in one round trip per poll
+FIND_FIRST_VISIBLE_JS = """rules => {
+    for (let i = 0; i < rules.length; i++) {
+        const [css, text] = rules[i];
+        for (const el of document.querySelectorAll(css)) {
+            const visible = el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden';
+            if (visible && (text === null || (el.textContent || '').toLowerCase().includes(text.toLowerCase()))) {
+                return [i, el];
+            }
+        }
+    }
+    return null;
+}"""
+
+# Resource types not needed to find and click a download button; requests for them are aborted.
+# Stylesheets are still loaded, since button visibility depends on them
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+
+# At most this many dynamic downloads (browser contexts) run at once; other workers wait
+MAX_BROWSER_CONTEXTS = 3
+browser_context_slots = threading.BoundedSemaphore(MAX_BROWSER_CONTEXTS)
 
 def setup_directories():
     """Create necessary directories if they don't exist."""
@@ -56,53 +317,212 @@ def setup_directories():
     logging.info(f"Directories setup complete.")
 
 async def setup_playwright():
-    """Initialize Playwright in headless mode."""
-    global playwright, browser
-    if playwright is None:
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(headless=True)  # Headless mode enabled
-    logging.info("Playwright initialized in headless mode.")
+    """Initialize Playwright in headless mode, once; later calls reuse the running browser."""
+    global playwright, browser, playwright_lock
+    if playwright_lock is None:
+        playwright_lock = asyncio.Lock()
+    async with playwright_lock:
+        if playwright is None:
+            playwright = await async_playwright().start()
+            browser = await playwright.chromium.launch(headless=True)  # Headless mode enabled
+            logging.info("Playwright initialized in headless mode.")
+    return browser
+
+def browser_state_path(host):
+    """Return the file a host's browser context storage state is saved to."""
+    return os.path.join(BROWSER_STATE_DIR, f"{UNSAFE_FILENAME_CHARS_RE.sub('_', host)}.json")
+
+async def close_host_context(host):
+    """Save a host's context storage state and close the context."""
+    context = host_contexts.pop(host)
+    host_context_users.pop(host, None)
+    host_pages.pop(host, None)  # closed with the context
+    try:
+        os.makedirs(BROWSER_STATE_DIR, exist_ok=True)
+        await context.storage_state(path=browser_state_path(host))
+    except Exception as e:
+        logging.warning(f"Could not save browser state for {host}: {e}")
+    await context.close()
+    logging.info(f"Playwright context for {host} closed")
+
+async def acquire_host_context(url):
+    """
+    Return the shared browser context for url's host, creating it on first use.
+    Every call must be paired with release_host_context.
+    """
+    browser = await setup_playwright()
+    host = urlparse(url).netloc
+    async with playwright_lock:
+        if host in host_contexts:
+            host_contexts.move_to_end(host)
+        else:
+            idle_hosts = [h for h in host_contexts if not host_context_users.get(h)]
+            for idle_host in idle_hosts[:max(0, len(host_contexts) + 1 - MAX_HOST_CONTEXTS)]:
+                await close_host_context(idle_host)
+            
+            state_path = browser_state_path(host)
+            context = await browser.new_context(
+                accept_downloads=True,
+                storage_state=state_path if os.path.exists(state_path) else None
+            )
+            context.set_default_timeout(30000)  # 30 second timeout for operations
+            await context.route("**/*", block_unneeded_resources)
+            host_contexts[host] = context
+            logging.info(f"Created Playwright context for {host}")
+        host_context_users[host] = host_context_users.get(host, 0) + 1
+        return host, host_contexts[host]
+
+async def acquire_page(host, context):
+    """Return an idle (page, navigations) pair of host's context, or a new page."""
+    idle_pages = host_pages.get(host)
+    if idle_pages:
+        return idle_pages.pop()
+    return await context.new_page(), 0
+
+async def release_page(host, page, navigations, reusable):
+    """
+    Blank a page and keep it for host's next URL, or close it if it is not reusable or has
+    reached MAX_PAGE_NAVIGATIONS.
+    """
+    try:
+        if reusable and navigations < MAX_PAGE_NAVIGATIONS and host in host_contexts:
+            await page.goto("about:blank")
+            host_pages.setdefault(host, []).append((page, navigations))
+            return
+        await page.close()
+    except Exception as e:
+        logging.debug(f"Could not release Playwright page: {e}")
+
+def release_host_context(host):
+    """Mark one user of a host's context as done; the context stays open for reuse."""
+    host_context_users[host] -= 1
 
 async def teardown_playwright():
-    """Close Playwright browser and stop Playwright."""
+    """Close the host contexts, the Playwright browser and stop Playwright."""
     global playwright, browser
+    for host in list(host_contexts):
+        await close_host_context(host)
     if browser:
         await browser.close()
     if playwright:
         await playwright.stop()
+    playwright = browser = None
     logging.info("Playwright terminated.")
 
-async def handle_dynamic_download(url):
-    """Use Playwright to download the file by clicking a download button."""
-    playwright = None
-    browser = None
-    context = None
+def get_playwright_loop():
+    """Return the event loop that owns the shared browser, starting its thread on first use."""
+    global playwright_loop
+    with playwright_loop_lock:
+        if playwright_loop is None:
+            playwright_loop = asyncio.new_event_loop()
+            threading.Thread(target=playwright_loop.run_forever, name="playwright", daemon=True).start()
+    return playwright_loop
+
+def run_dynamic_download(url, dest_dir=DOWNLOAD_DIR):
+    """Run handle_dynamic_download on the shared browser's loop and wait for its result. Callable from any thread."""
+    # Read the selector hit counts here, so the event loop thread never blocks on the file
+    with selector_hits_lock:
+        load_selector_hits()
+    with browser_context_slots:
+        future = asyncio.run_coroutine_threadsafe(handle_dynamic_download(url, dest_dir), get_playwright_loop())
+        return future.result()
+
+def shutdown_playwright():
+    """
+    Close the shared browser, if one was started, and stop its event loop. The selector hit
+    counts are saved here, off the event loop thread.
+    """
+    with playwright_loop_lock:
+        loop = playwright_loop
+    if loop is None:
+        return
+    asyncio.run_coroutine_threadsafe(teardown_playwright(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    save_selector_hits()
+
+def describe_rule(rule):
+    """Return a (CSS selector, text) rule written as the equivalent Playwright selector, for logging."""
+    css, text = rule
+    return f"{css}:has-text('{text}')" if text else css
+
+def load_selector_hits():
+    """Return the button rule hit counts, loading them from SELECTOR_HITS_FILE on first use."""
+    global selector_hits
+    if selector_hits is None:
+        selector_hits = load_json(SELECTOR_HITS_FILE)
+    return selector_hits
+
+def record_selector_hit(rule):
+    """Count a match of a button rule in memory; save_selector_hits persists the counts."""
+    with selector_hits_lock:
+        hits = load_selector_hits()
+        key = describe_rule(rule)
+        hits[key] = hits.get(key, 0) + 1
+
+def save_selector_hits():
+    """Persist the button rule hit counts to SELECTOR_HITS_FILE, if they were loaded."""
+    with selector_hits_lock:
+        if selector_hits is not None:
+            save_json(SELECTOR_HITS_FILE, selector_hits)
+
+async def find_first_visible(page, rules, timeout):
+    """
+    Wait up to timeout ms for any of rules to match a visible element, checking all of them
+    in the page in a single call per poll. Rules are tried in order of past hits.
+    Returns (rule, element handle) or (None, None).
+    """
+    with selector_hits_lock:
+        hits = dict(load_selector_hits())
+    # sorted is stable, so rules without hits keep their declared order
+    rules = sorted(rules, key=lambda rule: -hits.get(describe_rule(rule), 0))
+    try:
+        match = await page.wait_for_function(FIND_FIRST_VISIBLE_JS, arg=[list(rule) for rule in rules], timeout=timeout)
+    except PlaywrightTimeoutError:
+        return None, None
+    index = await (await match.get_property('0')).json_value()
+    element = (await match.get_property('1')).as_element()
+    record_selector_hit(rules[index])
+    return rules[index], element
+
+async def block_unneeded_resources(route):
+    """Abort requests for resources the download flow never looks at, let the rest through."""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def handle_dynamic_download(url, dest_dir=DOWNLOAD_DIR):
+    """
+    Use Playwright to download the file by clicking a download button.
+    Runs on the shared browser, in a page of the context kept for url's host.
+    """
+    host = page = None
+    navigations = 0
+    reusable = True
     
     try:
-        # Start Playwright and launch browser
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(headless=True)
-        
         logging.info(f"Starting dynamic download with Playwright for URL: {url}")
         
-        # Create browser context with downloads enabled
-        context = await browser.new_context(accept_downloads=True)
-        context.set_default_timeout(30000)  # 30 second timeout for operations
+        # Reuse the host's browser context (downloads enabled), creating it on first use
+        host, context = await acquire_host_context(url)
         
-        # Create a new page and navigate to URL
-        page = await context.new_page()
+        # Reuse an idle page of that context, or open one, and navigate to URL
+        page, navigations = await acquire_page(host, context)
+        navigations += 1
         logging.info(f"Navigating to URL: {url}")
         
-        # Navigate with a longer timeout for slow pages
-        response = await page.goto(url, wait_until="networkidle", timeout=60000)
+        # Navigate with a longer timeout for slow pages; the buttons are looked for with
+        # their own wait below, so there is no need to wait for the network to go idle
+        response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
         logging.info(f"Page loaded with status: {response.status}")
         
-        # Take a screenshot for debugging purposes
-        screenshots_dir = os.path.join(DOWNLOAD_DIR, "screenshots")
-        os.makedirs(screenshots_dir, exist_ok=True)
-        screenshot_path = os.path.join(screenshots_dir, f"page_{int(time.time())}.png")
-        await page.screenshot(path=screenshot_path)
-        logging.info(f"Screenshot saved to: {screenshot_path}")
+        # Take a screenshot for debugging purposes (only with --verbose)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            screenshots_dir = os.path.join(DOWNLOAD_DIR, "screenshots")
+            os.makedirs(screenshots_dir, exist_ok=True)
+            screenshot_path = os.path.join(screenshots_dir, f"page_{int(time.time())}.png")
+            await page.screenshot(path=screenshot_path)
+            logging.debug(f"Screenshot saved to: {screenshot_path}")
         
         # Get page title for logging
         title = await page.title()
@@ -111,34 +531,16 @@ async def handle_dynamic_download(url):
         # Handle cookie consent dialog before proceeding
         logging.info("Checking for cookie consent dialogs...")
         try:
-            # Try different common cookie consent selectors
-            cookie_selectors = [
-                "button#onetrust-accept-btn-handler",
-                "button[aria-label='Accept cookies']",
-                "button[aria-label='Aceitar cookies']",
-                "button:has-text('Accept')",
-                "button:has-text('Aceitar')",
-                "button:has-text('Accept All Cookies')",
-                "button:has-text('Aceitar Todos os Cookies')",
-                "[id*='cookie'] button:has-text('Accept')",
-                "[id*='cookie'] button:has-text('Aceitar')",
-                ".cookie-banner button:first-child",
-                "#cookieConsent button.accept",
-                "#gdpr-consent-tool-wrapper button[data-text-accept]",
-                "#consent-page button.consent-accept"
-            ]
-            
-            for selector in cookie_selectors:
+            # Try different common cookie consent selectors, all at once
+            rule, cookie_button = await find_first_visible(page, COOKIE_BUTTON_RULES, COOKIE_BUTTON_WAIT)
+            if cookie_button:
+                logging.info(f"Found cookie consent button with selector: {describe_rule(rule)}")
                 try:
-                    cookie_button = await page.wait_for_selector(selector, state="visible", timeout=3000)
-                    if cookie_button:
-                        logging.info(f"Found cookie consent button with selector: {selector}")
-                        await cookie_button.click()
-                        logging.info("Clicked cookie consent button")
-                        await page.wait_for_timeout(1500)  # Wait for overlay to disappear
-                        break
-                except:
-                    continue
+                    await cookie_button.click()
+                    logging.info("Clicked cookie consent button")
+                    await page.wait_for_timeout(1500)  # Wait for overlay to disappear
+                except Exception as e:
+                    logging.warning(f"Failed to click cookie consent button: {e}")
                     
             # Alternative approach: try to locate using a common cookie banner ID
             if await page.query_selector("#onetrust-banner-sdk"):
@@ -160,32 +562,10 @@ async def handle_dynamic_download(url):
         logging.info("Searching for download button...")
         download_button = None
         
-        # List of possible selectors for download buttons
-        selectors = [
-            "button:has-text('Baixar Arquivo')",
-            "button:has-text('Baixar')",
-            "a:has-text('Baixar Arquivo')",
-            "a:has-text('Baixar')",
-            "div.botaoBaixar",
-            "a.botaoBaixar",
-            "[data-test='download-button']",
-            "[aria-label='Baixar arquivo']",
-            "button:has-text('Download')",
-            "a:has-text('Download')"
-        ]
-        
-        # Try each selector
-        for selector in selectors:
-            try:
-                logging.info(f"Trying selector: {selector}")
-                # Use a shorter timeout for each individual selector
-                download_button = await page.wait_for_selector(selector, state="visible", timeout=3000)
-                if download_button:
-                    logging.info(f"Found download button with selector: {selector}")
-                    break
-            except:
-                logging.info(f"Selector not found: {selector}")
-                continue
+        # Check all the possible download button selectors at once
+        rule, download_button = await find_first_visible(page, DOWNLOAD_BUTTON_RULES, DOWNLOAD_BUTTON_WAIT)
+        if download_button:
+            logging.info(f"Found download button with selector: {describe_rule(rule)}")
         
         # If no button found with selectors, try to find by text content
         if not download_button:
@@ -209,7 +589,7 @@ async def handle_dynamic_download(url):
                         logging.info(f"Found element {i+1} with text: '{text_content}'")
                         break
                 except Exception as e:
-                    logging.debug(f"Error getting text content from element {i+1}: {e}")
+                    logging.debug("Error getting text content from element %d: %s", i + 1, e)
                     continue
         
         # If download button found, click it and download the file
@@ -261,13 +641,18 @@ async def handle_dynamic_download(url):
                 logging.info(f"Download started: {filename}")
                 
                 # Save the file
-                downloaded_path = os.path.join(DOWNLOAD_DIR, filename)
+                os.makedirs(dest_dir, exist_ok=True)
+                downloaded_path = os.path.join(dest_dir, filename)
                 await download.save_as(downloaded_path)
                 logging.info(f"Downloaded file: {downloaded_path}")
                 
-                # Check if file exists and has content
-                if os.path.exists(downloaded_path) and os.path.getsize(downloaded_path) > 0:
-                    logging.info(f"Download successful! File size: {os.path.getsize(downloaded_path)} bytes")
+                # Check if file exists and has content, with a single stat
+                try:
+                    file_size = os.stat(downloaded_path).st_size
+                except FileNotFoundError:
+                    file_size = 0
+                if file_size > 0:
+                    logging.info(f"Download successful! File size: {file_size} bytes")
                     return f"file://{os.path.abspath(downloaded_path)}"
                 else:
                     logging.error("Download failed: File is empty or doesn't exist")
@@ -300,12 +685,14 @@ async def handle_dynamic_download(url):
                 except:
                     pass
             
-            # Save page HTML for debugging
-            html_content = await page.content()
-            debug_html_path = os.path.join(DOWNLOAD_DIR, f"debug_page_{int(time.time())}.html")
-            with open(debug_html_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
-            logging.info(f"Saved page HTML to: {debug_html_path}")
+            # Save page HTML for debugging (only with --verbose), off the event loop and
+            # named per host and nanosecond so concurrent downloads don't overwrite each other
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                html_content = await page.content()
+                safe_host = UNSAFE_FILENAME_CHARS_RE.sub('_', host)
+                debug_html_path = os.path.join(DOWNLOAD_DIR, f"debug_page_{safe_host}_{time.time_ns()}.html")
+                await asyncio.to_thread(write_text_file, debug_html_path, html_content)
+                logging.debug(f"Saved page HTML to: {debug_html_path}")
             
             # Try one last fallback method - look for PDF links directly in the page
             pdf_links = await page.query_selector_all("a[href$='.pdf']")
@@ -326,93 +713,367 @@ async def handle_dynamic_download(url):
     except Exception as e:
         logging.error(f"Error with Playwright: {e}")
         logging.error(traceback.format_exc())
+        reusable = False  # the page may be left in an unknown state
+        return None
+    finally:
+        # Hand the page back; the browser, the host's context and its pages stay up for the next URL
+        if page:
+            await release_page(host, page, navigations, reusable)
+        if host:
+            release_host_context(host)
+        logging.info("Playwright page released")
+
+def probe_head(url, headers=None, timeout=PROBE_TIMEOUT):
+    """Return url if a HEAD request to it answers 200, otherwise None."""
+    logging.info(f"Trying direct URL: {url}")
+    try:
+        response = SESSION.head(url, headers=headers, timeout=timeout)
+        if response.status_code == 200:
+            return url
+    except Exception as e:
+        logging.warning(f"Error checking URL {url}: {e}")
+    return None
+
+def probe_urls(urls, headers=None):
+    """
+    HEAD-probe candidate URLs concurrently and return the first one that answers 200,
+    or None. Probes still queued when a working URL is found are cancelled.
+    """
+    executor = ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_PROBES, len(urls)))
+    try:
+        futures = [executor.submit(probe_head, url, headers) for url in urls]
+        for future in as_completed(futures):
+            found_url = future.result()
+            if found_url:
+                logging.info(f"Found working URL: {found_url}")
+                return found_url
         return None
     finally:
-        # Clean up resources
-        if context:
-            await context.close()
-        if browser:
-            await browser.close()
-        if playwright:
-            await playwright.stop()
-        logging.info("Playwright resources cleaned up")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def load_json(path):
+    """Return the contents of a JSON file, or an empty dict if it is missing or unreadable."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_text_file(path, text):
+    """Write text to path as UTF-8, creating its directory if needed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def save_json(path, data):
+    """Write data as JSON to a temporary file and move it into place, so readers never see a partial file."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not save {path}: {e}")
+
+def load_portal_scores():
+    """Return the pattern hit rates, loading them from PORTAL_CACHE_FILE on first use."""
+    global portal_scores
+    if portal_scores is None:
+        portal_scores = load_json(PORTAL_CACHE_FILE)
+    return portal_scores
+
+def record_portal_result(pattern, hit):
+    """Update a pattern's hit rate and persist all hit rates to PORTAL_CACHE_FILE."""
+    with portal_scores_lock:
+        scores = load_portal_scores()
+        scores[pattern] = (1 - PORTAL_SCORE_ALPHA) * scores.get(pattern, 0.0) + PORTAL_SCORE_ALPHA * hit
+        save_json(PORTAL_CACHE_FILE, scores)
+
+def is_pdf_url(url, headers=None):
+    """Return True if a GET of url answers 200 with a PDF. Only the headers are read."""
+    logging.info(f"Trying direct URL: {url}")
+    try:
+        with SESSION.get(url, headers=headers, stream=True, timeout=DEFAULT_TIMEOUT) as response:
+            return (response.status_code == 200 and
+                    'application/pdf' in response.headers.get('Content-Type', '').lower())
+    except Exception as e:
+        logging.warning(f"Error checking URL {url}: {e}")
+        return False
+
+def find_portal_file(filename, headers=None):
+    """
+    Return the first PORTAL_PATTERNS URL that serves filename, or None.
+    The pattern with the best hit rate is checked on its own first; only if it misses are
+    the remaining patterns HEAD-probed concurrently.
+    """
+    with portal_scores_lock:
+        scores = dict(load_portal_scores())
+    # sorted is stable, so patterns without history keep their PORTAL_PATTERNS order
+    patterns = sorted(PORTAL_PATTERNS, key=lambda pattern: -scores.get(pattern, 0.0))
+    urls = {pattern.format(filename=filename, filename_lower=filename.lower()): pattern for pattern in patterns}
+    
+    best_url = next(iter(urls))
+    if is_pdf_url(best_url, headers):
+        logging.info(f"Found working URL: {best_url}")
+        record_portal_result(urls[best_url], 1.0)
+        return best_url
+    record_portal_result(urls[best_url], 0.0)
+    
+    found_url = probe_urls(list(urls)[1:], headers)
+    if found_url:
+        record_portal_result(urls[found_url], 1.0)
+    return found_url
+
+def find_pdf_link(html):
+    """
+    Return the href of the first link to a .pdf in an HTML page, or None.
+    The page is parsed incrementally and parsing stops at the first match; the regex is
+    only a fallback for markup lxml cannot parse.
+    """
+    try:
+        for _, element in etree.iterparse(io.BytesIO(html), events=('start',), tag='a', html=True, recover=True):
+            href = element.get('href')
+            if href and href.endswith('.pdf'):
+                return href
+        return None
+    except etree.LxmlError as e:
+        logging.warning(f"Could not parse page for PDF links, falling back to regex: {e}")
+        pdf_url_match = PDF_HREF_RE.search(html)
+        return pdf_url_match.group(2).decode('utf-8', errors='replace') if pdf_url_match else None
+
+def has_download_button(html):
+    """Return True if an HTML page has a <button> labelled "Baixar Arquivo" (any case or spacing)."""
+    try:
+        for _, element in etree.iterparse(io.BytesIO(html), events=('end',), tag='button', html=True, recover=True):
+            if BAIXAR_ARQUIVO_RE.search(''.join(element.itertext())):
+                return True
+            element.clear()
+    except etree.LxmlError as e:
+        logging.warning(f"Could not parse page for download buttons: {e}")
+    return False
+
+def memoize_success(func):
+    """
+    Cache a URL resolver's results per URL, so a URL listed twice is only resolved once.
+    Any further arguments (e.g. dest_dir) are passed through but are not part of the key.
+    None results are not cached, so a resolution that failed is retried the next time.
+    """
+    results = {}
+    lock = threading.Lock()
+    
+    @functools.wraps(func)
+    def wrapper(url, *args):
+        with lock:
+            if url in results:
+                logging.info(f"Using previously resolved URL for {url}")
+                return results[url]
+        result = func(url, *args)
+        if result is not None:
+            with lock:
+                results[url] = result
+        return result
+    
+    return wrapper
+
+def is_samae_pe_81_2024(url):
+    """Return True for the SAMAE São Bento do Sul procurement PE 81/2024, whose edital lives at PORTAL_PATTERNS."""
+    return 'servico-autonomo-municipal-de-agua-e-esgoto-de-sao-bento-do-sul-samae' in url and 'pe-81-2024' in url
+
+def load_resolved_pdfs():
+    """Return the page-to-PDF URL mappings, loading them from RESOLVED_PDF_CACHE_FILE on first use."""
+    global resolved_pdfs
+    if resolved_pdfs is None:
+        resolved_pdfs = load_json(RESOLVED_PDF_CACHE_FILE)
+    return resolved_pdfs
+
+def resolve_direct_pdf(url, html=None, headers=None):
+    """
+    Find a direct PDF URL for a portal page with plain HTTP, so no browser is needed.
+    Tries a mapping remembered from an earlier run, the known SAMAE file locations and the
+    first .pdf link in the page (html, fetched if not given). Returns None if none of them
+    answers.
+    """
+    with resolved_pdfs_lock:
+        direct_url = load_resolved_pdfs().get(url)
+    if direct_url and probe_head(direct_url, headers, DIRECT_PDF_PROBE_TIMEOUT):
+        logging.info(f"Using remembered direct PDF URL: {direct_url}")
+        return direct_url
+    
+    direct_url = None
+    if is_samae_pe_81_2024(url):
+        direct_url = find_portal_file(SAMAE_EDITAL_FILENAME, headers)
+    
+    if not direct_url:
+        if html is None:
+            try:
+                html = SESSION.get(url, headers=headers, timeout=DEFAULT_TIMEOUT).content
+            except Exception as e:
+                logging.warning(f"Could not fetch {url} to look for PDF links: {e}")
+                return None
+        pdf_link = find_pdf_link(html)
+        if pdf_link:
+            pdf_link = urljoin(url, pdf_link)
+            logging.info(f"Found PDF URL in page: {pdf_link}")
+            direct_url = probe_head(pdf_link, headers, DIRECT_PDF_PROBE_TIMEOUT)
+    
+    if direct_url:
+        with resolved_pdfs_lock:
+            cache = load_resolved_pdfs()
+            cache[url] = direct_url
+            save_json(RESOLVED_PDF_CACHE_FILE, cache)
+    return direct_url
+
+def canonical_url(url):
+    """Return url with a lowercase scheme and host and without its fragment."""
+    parts = urlparse(url)
+    return parts._replace(scheme=parts.scheme.lower(), netloc=parts.netloc.lower(), fragment='').geturl()
+
+def load_resolutions():
+    """Return the remembered page resolutions, loading them from RESOLUTION_CACHE_FILE on first use."""
+    global resolutions
+    if resolutions is None:
+        resolutions = load_json(RESOLUTION_CACHE_FILE)
+    return resolutions
+
+def remembered_resolution(url, headers=None):
+    """Return what url resolved to in an earlier run, if it is still valid, or None."""
+    key = canonical_url(url)
+    with resolutions_lock:
+        entry = load_resolutions().get(key)
+    if not entry:
+        return None
+    resolved_url = entry['resolved_url']
+    if resolved_url.startswith('file://'):
+        # Downloads are always moved into place, so a replaced local file has a new inode
+        try:
+            stat = os.stat(resolved_url[7:])
+        except OSError:
+            return None
+        if (stat.st_ino, stat.st_size) != (entry.get('inode'), entry.get('size')):
+            return None
+    
+    if time.time() >= entry['expires_at']:
+        if not (entry['etag'] or entry['last_modified']):
+            return None
+        conditional_headers = dict(headers or {})
+        if entry['etag']:
+            conditional_headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            conditional_headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = SESSION.head(url, headers=conditional_headers, timeout=PROBE_TIMEOUT)
+        except Exception as e:
+            logging.warning(f"Could not revalidate {url}: {e}")
+            return None
+        if response.status_code != 304:
+            return None
+        with resolutions_lock:
+            entry['expires_at'] = time.time() + RESOLUTION_TTL
+            save_json(RESOLUTION_CACHE_FILE, load_resolutions())
+    
+    logging.info(f"Using remembered resolution for {url}: {resolved_url}")
+    return resolved_url
+
+def remember_resolution(url, resolved_url, page_headers):
+    """
+    Note what url resolved to, with the page's validators for later revalidation. It is only
+    persisted by confirm_resolution, once resolved_url was downloaded and turned out a PDF.
+    """
+    if resolved_url in GUESSED_PDF_URLS:
+        return
+    with resolutions_lock:
+        pending_resolutions[resolved_url] = {
+            'page_url': canonical_url(url),
+            'resolved_url': resolved_url,
+            'etag': page_headers.get('ETag'),
+            'last_modified': page_headers.get('Last-Modified')
+        }
 
-def handle_portal_compras_publicas(url):
+def confirm_resolution(resolved_url):
+    """Persist the pending resolution to resolved_url, if any, now that it was downloaded as a PDF."""
+    with resolutions_lock:
+        entry = pending_resolutions.pop(resolved_url, None)
+        if entry is None:
+            return
+        page_url = entry.pop('page_url')
+        entry['expires_at'] = time.time() + RESOLUTION_TTL
+        if resolved_url.startswith('file://'):
+            stat = os.stat(resolved_url[7:])
+            entry.update(inode=stat.st_ino, size=stat.st_size)
+        cache = load_resolutions()
+        cache[page_url] = entry
+        save_json(RESOLUTION_CACHE_FILE, cache)
+
+@memoize_success
+def handle_portal_compras_publicas(url, dest_dir=DOWNLOAD_DIR):
     """
-    Handle URLs from Portal de Compras Públicas by extracting the PDF links
+    Handle URLs from Portal de Compras Públicas by extracting the PDF links.
+    A file that has to be downloaded with Playwright is saved into dest_dir.
+    A resolution remembered from an earlier run is reused while it is valid; a new one is
+    remembered once download_file has fetched it as a PDF.
     """
     logging.info(f"Processing Portal de Compras Públicas URL: {url}")
     
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Referer': url
-    }
+    headers = {'Referer': url}
+    resolved_url = remembered_resolution(url, headers)
+    if resolved_url:
+        return resolved_url
     
+    page = None
     try:
-        # First check if this page requires dynamic interaction
+        page = SESSION.get(url, headers=headers, timeout=PROBE_TIMEOUT)
+    except Exception as e:
+        logging.warning(f"Error fetching page: {e}")
+    
+    resolved_url = resolve_portal_compras_publicas(url, page.content if page is not None else None, headers, dest_dir)
+    if resolved_url:
+        remember_resolution(url, resolved_url, page.headers if page is not None else {})
+    return resolved_url
+
+def resolve_portal_compras_publicas(url, html, headers, dest_dir=DOWNLOAD_DIR):
+    """
+    Find the PDF for a Portal de Compras Públicas page, given its HTML (None if it could not
+    be fetched). A file downloaded with Playwright is saved into dest_dir.
+    """
+    try:
+        # Fast path: known file locations and direct PDF links, checked without a browser
+        direct_url = resolve_direct_pdf(url, html, headers)
+        if direct_url:
+            return direct_url
+        
+        # Then check if this page requires dynamic interaction
         try:
-            response = requests.get(url, headers=headers, timeout=5)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Check for download buttons
-            download_buttons = soup.find_all('button', string=re.compile(r'Baixar\s*Arquivo', re.IGNORECASE))
-            if download_buttons or 'Baixar Arquivo' in response.text:
+            if html is not None and (b'Baixar Arquivo' in html or has_download_button(html)):
                 logging.info("Detected dynamic page requiring Playwright for button click.")
-                return asyncio.run(handle_dynamic_download(url))
+                dynamic_url = run_dynamic_download(url, dest_dir)
+                if dynamic_url:
+                    return dynamic_url
         except Exception as e:
             logging.warning(f"Error checking for dynamic content: {e}")
             
         # Continue with existing static URL handling code
         # Check if this is the specific SAMAE São Bento do Sul procurement
-        if 'servico-autonomo-municipal-de-agua-e-esgoto-de-sao-bento-do-sul-samae' in url and 'pe-81-2024' in url:
+        if is_samae_pe_81_2024(url):
             logging.info("Detected SAMAE São Bento do Sul procurement PE 81/2024")
             
-            # From your screenshot, we can see the document is available as EDITAL202481.pdf
-            # Try several possible locations based on the portal's patterns
-            possible_urls = [
-                "https://www.portaldecompraspublicas.com.br/sitetema/files/editais/EDITAL202481.pdf",
-                "https://www.portaldecompraspublicas.com.br/3/pt-br/download/EDITAL202481.pdf",
-                "https://arquivos.portaldecompraspublicas.com.br/EDITAL202481.pdf",
-                "https://arquivos.portaldecompraspublicas.com.br/editais/EDITAL202481.pdf",
-                "https://www.portaldecompraspublicas.com.br/editais/2024/EDITAL202481.pdf",
-                # Try with lowercase too
-                "https://www.portaldecompraspublicas.com.br/sitetema/files/editais/edital202481.pdf",
-                "https://www.portaldecompraspublicas.com.br/3/pt-br/download/edital202481.pdf"
-            ]
-            
-            # Try the direct download URLs
-            for direct_url in possible_urls:
-                logging.info(f"Trying direct URL: {direct_url}")
-                try:
-                    response = requests.head(direct_url, headers=headers, timeout=5)
-                    if response.status_code == 200:
-                        logging.info(f"Found working URL: {direct_url}")
-                        return direct_url
-                except Exception as e:
-                    logging.warning(f"Error checking URL {direct_url}: {e}")
-                    continue
-            
             # If none of the predefined URLs work, we'll copy from a successful download we already have
             logging.info("Using existing EDITAL202481.pdf from previous successful download")
             
             # Check if we already have this file from another URL
-            existing_file = os.path.join(DOWNLOAD_DIR, "EDITAL202481.pdf")
-            if os.path.exists(existing_file):
-                logging.info(f"Using existing file from {existing_file}")
-                return f"file://{os.path.abspath(existing_file)}"
+            if os.path.exists(SAMAE_EXISTING_FILE):
+                logging.info(f"Using existing file from {SAMAE_EXISTING_FILE}")
+                return f"file://{SAMAE_EXISTING_FILE}"
             
             # If we can't find the file through predefined patterns, 
             # as a last resort, copy from example2.pdf which should be the same document
-            pdf_file = os.path.join(PDF_DIR, "example2.pdf")
-            if os.path.exists(pdf_file):
-                logging.info(f"Copying from existing PDF: {pdf_file}")
+            if os.path.exists(SAMAE_FALLBACK_PDF):
+                logging.info(f"Copying from existing PDF: {SAMAE_FALLBACK_PDF}")
                 # Create a special URL scheme to signal to download_file that this is a local file
-                return f"file://{os.path.abspath(pdf_file)}"
+                return f"file://{SAMAE_FALLBACK_PDF}"
         
         # Extract process ID from URL
-        process_id_match = re.search(r'/(\d+-\d+)$', url)
+        process_id_match = PROCESS_ID_RE.search(url)
         if process_id_match:
             process_id = process_id_match.group(1)
             logging.info(f"Extracted process ID: {process_id}")
@@ -420,49 +1081,34 @@ def handle_portal_compras_publicas(url):
             # Construct direct download URL for the Edital
             # Format typically follows: https://www.portaldecompraspublicas.com.br/Download/?ttCD_CHAVE=XXXX&ttCD_TIPO_DOWNLOAD=1
             # Try direct download based on URL pattern
-            direct_url = f"https://www.portaldecompraspublicas.com.br/processos/sc/servico-autonomo-municipal-de-agua-e-esgoto-de-sao-bento-do-sul-samae-2513/pe-81-2024-2024-343451/download/"
+            direct_url = SAMAE_DOWNLOAD_URL
             logging.info(f"Attempting direct download URL: {direct_url}")
             
-            response = requests.get(direct_url, headers=headers, allow_redirects=True)
-            if response.status_code == 200 and response.headers.get('Content-Type', '').lower().startswith('application/pdf'):
+            with SESSION.get(direct_url, headers=headers, allow_redirects=True, stream=True, timeout=DEFAULT_TIMEOUT) as response:
+                is_direct_pdf = (response.status_code == 200 and
+                                 response.headers.get('Content-Type', '').lower().startswith('application/pdf'))
+            if is_direct_pdf:
                 logging.info(f"Successfully found direct download URL: {direct_url}")
                 return direct_url
             
             # If not working, try to find the file from the "https://portaldecompraspublicas.com.br/3/upl/" pattern
             # This is a common pattern for their file hosting
             logging.info("Trying alternate approach: construct manual download URL for EDITAL202481.pdf")
-            direct_url = "https://portaldecompraspublicas.com.br/3/upl/EDITAL202481.pdf"
+            direct_url = SAMAE_UPL_URL
             
             # Verify this URL works
-            response = requests.head(direct_url, headers=headers)
+            response = SESSION.head(direct_url, headers=headers, timeout=DEFAULT_TIMEOUT)
             if response.status_code == 200:
                 logging.info(f"Found Edital using alternate URL pattern: {direct_url}")
                 return direct_url
         
-        # Fallback to HTML parsing
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        # Look for any PDF download links in the page
-        pdf_url_match = re.search(r'href="([^"]+\.pdf)"', response.text) or re.search(r"href='([^']+\.pdf)'", response.text)
-        if pdf_url_match:
-            pdf_url = pdf_url_match.group(1)
-            if not pdf_url.startswith('http'):
-                if pdf_url.startswith('/'):
-                    base_url = '/'.join(url.split('/')[:3])  # Get domain part
-                    pdf_url = base_url + pdf_url
-                else:
-                    pdf_url = os.path.dirname(url) + '/' + pdf_url
-            logging.info(f"Found PDF URL through regex: {pdf_url}")
-            return pdf_url
-        
         # If all above fails, we'll need to simulate a user clicking the download button
         logging.warning("Unable to find direct PDF URL. Portal de Compras Públicas requires simulation of user clicks.")
         logging.warning("Using a workaround to manually construct the URL to EDITAL202481.pdf")
         
         # For PCP-4215802-5-812024, we know from manual inspection that the file is EDITAL202481.pdf
         # Let's try the direct URL as a last resort
-        fallback_url = "https://portaldecompraspublicas.com.br/3/upl/EDITAL202481.pdf"
+        fallback_url = SAMAE_UPL_URL
         logging.info(f"Attempting fallback URL for well-known file: {fallback_url}")
         return fallback_url
         
@@ -471,133 +1117,419 @@ def handle_portal_compras_publicas(url):
         logging.error(traceback.format_exc())
         return None
 
-def download_file(url, headers=None):
+def sniff_extension(head):
+    """Return the file extension matching the magic bytes at the start of a file, or None."""
+    return next((ext for magic, ext in MAGIC_EXTENSIONS.items() if head.startswith(magic)), None)
+
+def write_in_background(body, f, digest):
+    """
+    Read body on this thread while a writer thread hashes the chunks into digest and writes
+    them to f. Raises the writer's error, if any, once the whole body has been read.
     """
-    Download a file from a URL and determine its filename.
+    chunks = queue.Queue(WRITE_QUEUE_DEPTH)
+    
+    def write_chunks():
+        error = None
+        # Keep draining after an error so the reader never blocks on a full queue
+        while (chunk := chunks.get()) is not None:
+            if error is None:
+                try:
+                    digest.update(chunk)
+                    f.write(chunk)
+                except OSError as e:
+                    error = e
+        if error:
+            raise error
+    
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        written = writer.submit(write_chunks)
+        try:
+            while chunk := body.read(COPY_BUFFER_SIZE):
+                chunks.put(chunk)
+        finally:
+            chunks.put(None)
+        written.result()
+
+def has_pdf_magic(file_path):
+    """Return True if a file starts with the PDF magic bytes."""
+    with open(file_path, 'rb') as f:
+        return sniff_extension(f.read(8)) == '.pdf'
+
+def save_download(response, dest_dir=DOWNLOAD_DIR):
+    """
+    Stream a successful download response to dest_dir, naming it from its headers or magic bytes.
+    Returns (success, file_path, is_pdf)
+    """
+    # Peek at the first bytes to sniff the file type without consuming them
+    response.raw.decode_content = True
+    body = io.BufferedReader(response.raw, COPY_BUFFER_SIZE)
+    sniffed_ext = sniff_extension(body.peek(8)[:8])
+    
+    # Try to get the filename from the Content-Disposition header
+    content_disposition = response.headers.get('Content-Disposition', '')
+    filename_match = FILENAME_RE.search(content_disposition)
+    
+    if filename_match:
+        filename = filename_match.group(1)
+        logging.info(f"Extracted filename from Content-Disposition: {filename}")
+    else:
+        # Guess the file extension from the content type, then from the first few bytes,
+        # defaulting to .bin if we can't determine the type
+        content_type = response.headers.get('Content-Type', '')
+        ext = next((ext for type_name, ext in CONTENT_TYPE_EXTENSIONS.items() if type_name in content_type), None)
+        ext = ext or sniffed_ext or '.bin'
+        
+        # Create a default filename
+        filename = f"download{ext}"
+        logging.info(f"Generated filename: {filename}")
+    
+    # Clean the filename
+    filename = UNSAFE_FILENAME_CHARS_RE.sub('_', filename)
+    
+    # Determine if the file is a PDF
+    is_pdf = ('application/pdf' in response.headers.get('Content-Type', '') or 
+             filename.lower().endswith('.pdf') or
+             sniffed_ext == '.pdf')
+    
+    # Save the file
+    os.makedirs(dest_dir, exist_ok=True)
+    file_path = os.path.join(dest_dir, filename)
+    # Write next to the target and move it into place, so a file hard-linked into PDF_DIR
+    # by an earlier run is replaced rather than overwritten through the link
+    tmp_path = f"{file_path}.part"
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as f:
+            if int(response.headers.get('Content-Length') or 0) > LARGE_DOWNLOAD_SIZE:
+                write_in_background(body, f, digest)
+            else:
+                while chunk := body.read(COPY_BUFFER_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+        link_duplicate(digest.hexdigest(), tmp_path, file_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        # Don't leave a partial download behind
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    logging.info(f"Successfully downloaded file to {file_path}")
+    
+    return True, file_path, is_pdf
+
+def load_content_index():
+    """Return the content hash index, loading it from CONTENT_INDEX_FILE on first use."""
+    global content_index
+    if content_index is None:
+        content_index = load_json(CONTENT_INDEX_FILE)
+    return content_index
+
+def link_duplicate(sha256, tmp_path, file_path):
+    """
+    If a file with the same content was downloaded before, replace tmp_path with a hard link
+    to it; otherwise remember file_path as the copy of this content.
+    """
+    with content_index_lock:
+        index = load_content_index()
+        entry = index.get(sha256)
+        if entry and entry['path'] != file_path:
+            try:
+                # Downloads are always moved into place, so an unchanged inode means unchanged content
+                stat = os.stat(entry['path'])
+                if (stat.st_ino, stat.st_size) == (entry['inode'], entry['size']):
+                    link_path = f"{file_path}.link"
+                    os.link(entry['path'], link_path)
+                    os.replace(link_path, tmp_path)
+                    logging.info(f"Same content as {entry['path']}, hard-linked instead of keeping a second copy")
+                    return
+            except OSError as e:
+                logging.debug(f"Could not hard-link {entry['path']}: {e}")
+        stat = os.stat(tmp_path)
+        index[sha256] = {'path': file_path, 'inode': stat.st_ino, 'size': stat.st_size}
+        save_json(CONTENT_INDEX_FILE, index)
+
+def load_download_cache():
+    """Return the download cache index, loading it from DOWNLOAD_CACHE_FILE on first use."""
+    global download_cache
+    if download_cache is None:
+        download_cache = load_json(DOWNLOAD_CACHE_FILE)
+    return download_cache
+
+def cached_download(url, dest_dir):
+    """
+    Return the cache entry of an earlier download of url whose file is unchanged since, or None.
+    The file is linked into dest_dir first, so a later download into the folder it came from
+    cannot swap it out, and the entry returned points at that link.
+    """
+    with download_cache_lock:
+        entry = load_download_cache().get(url)
+    if not entry or 'inode' not in entry:
+        return None
+    
+    file_path = os.path.join(dest_dir, os.path.basename(entry['path']))
+    try:
+        if os.path.abspath(file_path) != os.path.abspath(entry['path']):
+            os.makedirs(dest_dir, exist_ok=True)
+            link_or_copy(entry['path'], file_path)
+        # Downloads are always moved into place, so the inode recorded for url is only still
+        # there if its file was not replaced since (a copy also fails this, and is refetched)
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    if (stat.st_ino, stat.st_size) != (entry['inode'], entry['size']):
+        logging.info(f"{entry['path']} changed since {url} was downloaded, not revalidating it")
+        return None
+    return dict(entry, path=file_path)
+
+def record_download(url, headers, file_path, is_pdf):
+    """Remember a download's validators (from its response headers) so the next run can send a conditional GET."""
+    etag = headers.get('ETag')
+    last_modified = headers.get('Last-Modified')
+    with download_cache_lock:
+        cache = load_download_cache()
+        if etag or last_modified:
+            stat = os.stat(file_path)
+            cache[url] = {'etag': etag, 'last_modified': last_modified, 'path': file_path, 'is_pdf': is_pdf,
+                          'inode': stat.st_ino, 'size': stat.st_size}
+        elif cache.pop(url, None) is None:
+            return
+        save_json(DOWNLOAD_CACHE_FILE, cache)
+
+def download_file(url, headers=None, session=SESSION, dest_dir=DOWNLOAD_DIR):
+    """
+    Download a file from a URL into dest_dir and determine its filename.
     Returns (success, file_path, is_pdf)
     """
     # Handle local file URLs (special case for PCP-format URLs)
     if url.startswith('file://'):
         local_path = url[7:]  # Remove the 'file://' prefix
-        if os.path.exists(local_path):
-            logging.info(f"Using local file: {local_path}")
-            filename = os.path.basename(local_path)
-            dest_path = os.path.join(DOWNLOAD_DIR, filename)
-            
+        filename = os.path.basename(local_path)
+        dest_path = os.path.join(dest_dir, filename)
+        try:
             # Copy the file to the downloads directory if it's not already there
             if os.path.abspath(local_path) != os.path.abspath(dest_path):
-                shutil.copy2(local_path, dest_path)
-                logging.info(f"Copied local file to {dest_path}")
-            
-            return True, dest_path, True  # Assuming it's a PDF
-        else:
+                os.makedirs(dest_dir, exist_ok=True)
+                action = link_or_copy(local_path, dest_path)
+                logging.info(f"Using local file: {local_path}")
+                logging.info(f"{action} local file to {dest_path}")
+            else:
+                os.stat(local_path)
+                logging.info(f"Using local file: {local_path}")
+        except FileNotFoundError:
             logging.error(f"Local file not found: {local_path}")
             return False, None, False
+        
+        if has_pdf_magic(dest_path):
+            confirm_resolution(url)
+        return True, dest_path, True  # Assuming it's a PDF
     
     if headers is None:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-            'Cache-Control': 'max-age=0'
-        }
+        headers = DOWNLOAD_HEADERS
+    
+    # Revalidate an earlier download instead of fetching it again
+    cached = cached_download(url, dest_dir)
+    if cached:
+        headers = dict(headers)
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
     
     logging.info(f"Sending GET request to {url}")
     try:
-        response = requests.get(url, headers=headers, allow_redirects=True)
-        logging.info(f"Status code: {response.status_code}")
-        logging.info(f"Content type: {response.headers.get('Content-Type')}")
-        logging.info(f"Content length: {len(response.content)} bytes")
-        logging.debug(f"Response headers: {json.dumps(dict(response.headers), indent=2)}")
-        
-        if response.status_code != 200:
-            logging.error(f"Error: Received status code {response.status_code}")
-            logging.error(f"Response content: {response.text[:500]}...")  # Print first 500 chars of response
-            return False, None, False
-        
-        # If we got HTML and it's from portaldecompraspublicas.com.br, we need to extract the PDF URL
-        if 'text/html' in response.headers.get('Content-Type', '').lower() and 'portaldecompraspublicas.com.br' in url:
-            logging.info("Detected Portal de Compras Públicas page, processing...")
-            pdf_url = handle_portal_compras_publicas(url)
-            if pdf_url:
-                if pdf_url.startswith('file://'):
-                    # This is a locally downloaded file from Playwright
-                    return download_file(pdf_url, headers)
-                else:
-                    # This is a URL to download
-                    return download_file(pdf_url, headers)
-            else:
-                logging.error("Failed to extract PDF URL from Portal de Compras Públicas page")
-                # Try Playwright as a last resort
-                logging.info("Attempting Playwright as a last resort")
-                pdf_url = asyncio.run(handle_dynamic_download(url))
-                if pdf_url:
-                    return download_file(pdf_url, headers)
+        # Stream the body so large archives go straight to disk instead of being held in memory
+        with session.get(url, headers=headers, allow_redirects=True, stream=True, timeout=DEFAULT_TIMEOUT) as response:
+            logging.info(f"Status code: {response.status_code}")
+            logging.info(f"Content type: {response.headers.get('Content-Type')}")
+            logging.info(f"Content length: {response.headers.get('Content-Length', 'unknown')} bytes")
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("Response headers: %s", json.dumps(dict(response.headers), indent=2))
+            
+            if response.status_code == 304 and cached:
+                logging.info(f"Not modified since the last download, reusing {cached['path']}")
+                record_download(url, {'ETag': cached['etag'], 'Last-Modified': cached['last_modified']},
+                                cached['path'], cached['is_pdf'])
+                return True, cached['path'], cached['is_pdf']
+            
+            if response.status_code != 200:
+                logging.error(f"Error: Received status code {response.status_code}")
+                logging.error(f"Response content: {response.text[:500]}...")  # Print first 500 chars of response
                 return False, None, False
-        
-        # Try to get the filename from the Content-Disposition header
-        content_disposition = response.headers.get('Content-Disposition', '')
-        filename_match = re.search(r'filename=[\'"]?([^\'"]+)', content_disposition)
-        
-        if filename_match:
-            filename = filename_match.group(1)
-            logging.info(f"Extracted filename from Content-Disposition: {filename}")
-        else:
-            # Try to guess the file extension based on the content
-            content_type = response.headers.get('Content-Type', '')
-            if 'application/pdf' in content_type:
-                ext = '.pdf'
-            elif 'application/zip' in content_type:
-                ext = '.zip'
-            elif 'application/x-rar-compressed' in content_type:
-                ext = '.rar'
-            else:
-                # Try to guess the extension from the first few bytes
-                if response.content.startswith(b'%PDF'):
-                    ext = '.pdf'
-                elif response.content.startswith(b'PK\x03\x04'):
-                    ext = '.zip'
-                elif response.content.startswith(b'Rar!'):
-                    ext = '.rar'
-                else:
-                    # Default to .bin if we can't determine the type
-                    ext = '.bin'
             
-            # Create a default filename
-            filename = f"download{ext}"
-            logging.info(f"Generated filename: {filename}")
-        
-        # Clean the filename
-        filename = re.sub(r'[^\w\-\.]', '_', filename)
-        
-        # Determine if the file is a PDF
-        is_pdf = ('application/pdf' in response.headers.get('Content-Type', '') or 
-                 filename.lower().endswith('.pdf') or
-                 response.content.startswith(b'%PDF'))
+            # If we got HTML and it's from portaldecompraspublicas.com.br, we need to extract the PDF URL
+            is_portal_page = 'text/html' in response.headers.get('Content-Type', '').lower() and 'portaldecompraspublicas.com.br' in url
+            if not is_portal_page:
+                success, file_path, is_pdf = save_download(response, dest_dir)
+                if has_pdf_magic(file_path):
+                    confirm_resolution(url)
+                record_download(url, response.headers, file_path, is_pdf)
+                return success, file_path, is_pdf
         
-        # Save the file
-        file_path = os.path.join(DOWNLOAD_DIR, filename)
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
-        logging.info(f"Successfully downloaded file to {file_path}")
-        
-        return True, file_path, is_pdf
+        # Portal pages are handled after the with block, so their connection goes back to the pool first
+        logging.info("Detected Portal de Compras Públicas page, processing...")
+        pdf_url = handle_portal_compras_publicas(url, dest_dir)
+        if pdf_url:
+            if pdf_url.startswith('file://'):
+                # This is a locally downloaded file from Playwright
+                return download_file(pdf_url, headers, session, dest_dir)
+            else:
+                # This is a URL to download
+                return download_file(pdf_url, headers, session, dest_dir)
+        else:
+            logging.error("Failed to extract PDF URL from Portal de Compras Públicas page")
+            # Try Playwright as a last resort
+            logging.info("Attempting Playwright as a last resort")
+            pdf_url = run_dynamic_download(url, dest_dir)
+            if pdf_url:
+                return download_file(pdf_url, headers, session, dest_dir)
+            return False, None, False
     
     except Exception as e:
         logging.error(f"Error downloading file: {e}")
         logging.error(traceback.format_exc())
         return False, None, False
 
-def extract_archive(archive_path, extract_dir):
-    """Extract an archive using unar."""
+def copy_file(src, dest):
+    """
+    Copy a file with its metadata, like shutil.copy2, but let the kernel move the bytes.
+    os.copy_file_range can share extents (reflink) on btrfs/xfs; where it is unavailable or
+    fails (e.g. EXDEV on older kernels) os.sendfile copies with as few calls as possible.
+    Elsewhere shutil.copyfile is used, which clones files on macOS/APFS.
+    """
+    # Kernel copy functions, all called as (fd_in, fd_out, count)
+    kernel_copies = []
+    if hasattr(os, 'copy_file_range'):
+        kernel_copies.append(os.copy_file_range)
+    if sys.platform.startswith('linux'):
+        kernel_copies.append(lambda fd_in, fd_out, count: os.sendfile(fd_out, fd_in, None, count))
+    
+    for kernel_copy in kernel_copies:
+        try:
+            with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = kernel_copy(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining <= 0:
+                shutil.copystat(src, dest)
+                return
+        except OSError:
+            pass  # e.g. EXDEV or an unsupported filesystem; try the next method
+    shutil.copyfile(src, dest)
+    shutil.copystat(src, dest)
+
+def link_or_copy(src, dest):
+    """
+    Hard-link src to dest, copying instead when linking is not possible (e.g. across filesystems).
+    Returns "Linked" or "Copied".
+    """
+    try:
+        os.link(src, dest)
+        return "Linked"
+    except FileExistsError:
+        os.remove(dest)
+        return link_or_copy(src, dest)
+    except FileNotFoundError:
+        raise  # src is missing, so copying would fail too
+    except OSError:
+        copy_file(src, dest)
+        return "Copied"
+
+def open_archive(file, archive_ext):
+    """Open a path or file object as a ZipFile or RarFile, or return None if it cannot be read in-process."""
+    if archive_ext == '.zip':
+        return zipfile.ZipFile(file)
+    if archive_ext == '.rar' and rarfile is not None:
+        return rarfile.RarFile(file)
+    return None
+
+def extract_pdf_members(archive, extract_dir, depth=0):
+    """
+    Extract only the PDF members of an open archive into extract_dir. Nested ZIP/RAR
+    members are read straight from the outer archive, never written to disk, and their
+    PDFs extracted into a subdirectory named after them. Returns the number of PDFs extracted.
+    """
+    extracted = 0
+    for member in archive.infolist():
+        name = member.filename.lower()
+        if name.endswith('.pdf'):
+            archive.extract(member, extract_dir)
+            extracted += 1
+        elif name.endswith(ARCHIVE_SUFFIXES):
+            if depth >= MAX_ARCHIVE_DEPTH:
+                logging.warning(f"Not extracting archives nested more than {MAX_ARCHIVE_DEPTH} levels deep: {member.filename}")
+                continue
+            logging.info(f"Found nested archive: {member.filename}")
+            nested_dir = os.path.join(extract_dir, os.path.splitext(os.path.basename(member.filename))[0])
+            try:
+                with archive.open(member) as f:
+                    nested = open_archive(f, os.path.splitext(name)[1])
+                    if nested is None:
+                        continue
+                    with nested:
+                        extracted += extract_pdf_members(nested, nested_dir, depth + 1)
+            except ARCHIVE_ERRORS as e:
+                logging.warning(f"Could not read nested archive {member.filename}: {e}")
+    return extracted
+
+def extract_first_pdf(archive, dest_path, depth=0):
+    """
+    Stream the first PDF member of an open archive, in archive order and looking inside
+    nested ZIP/RAR members, straight to dest_path. Returns True if a PDF was written.
+    """
+    for member in archive.infolist():
+        name = member.filename.lower()
+        if name.endswith('.pdf'):
+            logging.info(f"Found PDF in archive: {member.filename}")
+            tmp_path = f"{dest_path}.part"
+            try:
+                with archive.open(member) as src, open(tmp_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+                os.replace(tmp_path, dest_path)
+            except BaseException:
+                # Don't leave a partial copy behind, e.g. after a CRC error on a truncated member
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            return True
+        if name.endswith(ARCHIVE_SUFFIXES) and depth < MAX_ARCHIVE_DEPTH:
+            try:
+                with archive.open(member) as f:
+                    nested = open_archive(f, os.path.splitext(name)[1])
+                    if nested is None:
+                        continue
+                    with nested:
+                        if extract_first_pdf(nested, dest_path, depth + 1):
+                            return True
+            except ARCHIVE_ERRORS as e:
+                logging.warning(f"Could not read nested archive {member.filename}: {e}")
+    return False
+
+def extract_archive(archive_path, extract_dir, pdfs_only=False):
+    """
+    Extract a ZIP or RAR archive in-process, falling back to unar for other formats or on failure.
+    With pdfs_only, only PDF members are extracted (including those of nested archives);
+    the unar fallback still extracts everything.
+    """
     logging.info(f"Extracting {archive_path} to {extract_dir}")
+    with open(archive_path, 'rb') as f:
+        archive_ext = sniff_extension(f.read(8))
+    
+    try:
+        archive = open_archive(archive_path, archive_ext)
+        if archive is not None:
+            with archive:
+                if pdfs_only:
+                    logging.info(f"Extracted {extract_pdf_members(archive, extract_dir)} PDF files")
+                else:
+                    archive.extractall(extract_dir)
+            logging.info("Extraction successful!")
+            return True
+    except ARCHIVE_ERRORS as e:
+        logging.warning(f"In-process extraction of {archive_path} failed ({e}), retrying with unar")
+    
     try:
         result = subprocess.run(['unar', '-force-overwrite', '-o', extract_dir, archive_path], 
                               capture_output=True, text=True, check=True)
@@ -613,50 +1545,47 @@ def extract_archive(archive_path, extract_dir):
         logging.error("You can install it with: brew install unar")
         return False
 
+def scan_files(root_dir, suffixes):
+    """
+    Yield the paths of files under root_dir whose lowercase name ends with one of suffixes.
+    Uses os.scandir, whose entries carry their file type, so no extra stat calls are needed.
+    """
+    stack = [root_dir]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(suffixes):
+                    yield entry.path
+
 def find_and_extract_nested_archives(extract_dir):
     """Find and extract any nested archives in the extracted directory."""
-    for root, dirs, files in os.walk(extract_dir):
-        for file in files:
-            if file.lower().endswith('.rar') or file.lower().endswith('.zip'):
-                nested_archive = os.path.join(root, file)
-                logging.info(f"\nFound nested archive: {nested_archive}")
-                
-                # Create a subdirectory for this nested archive
-                nested_extract_dir = os.path.join(extract_dir, os.path.splitext(file)[0])
-                os.makedirs(nested_extract_dir, exist_ok=True)
-                
-                # Extract the nested archive
-                extract_archive(nested_archive, nested_extract_dir)
+    # Collect the matches before extracting, since extraction adds new directories to the tree
+    for nested_archive in list(scan_files(extract_dir, ('.rar', '.zip'))):
+        logging.info(f"\nFound nested archive: {nested_archive}")
+        
+        # Create a subdirectory for this nested archive
+        nested_extract_dir = os.path.join(extract_dir, os.path.splitext(os.path.basename(nested_archive))[0])
+        os.makedirs(nested_extract_dir, exist_ok=True)
+        
+        # Extract the nested archive
+        extract_archive(nested_archive, nested_extract_dir)
 
 def copy_pdfs_to_pdf_dir(source_dir):
-    """Copy all PDFs from source_dir to PDF_DIR."""
-    pdf_files = []
-    for root, dirs, files in os.walk(source_dir):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                pdf_files.append(os.path.join(root, file))
-    
-    if pdf_files:
-        logging.info(f"\nFound {len(pdf_files)} PDF files:")
-        for pdf_file in pdf_files:
-            logging.info(f"- {pdf_file}")
-        
-        # Copy PDFs to the PDF directory
-        for pdf_file in pdf_files:
-            # Get the base filename
-            base_name = os.path.basename(pdf_file)
-            
-            # Create a destination path
-            dest_path = os.path.join(PDF_DIR, base_name)
-            
-            # Copy the file
-            try:
-                shutil.copy2(pdf_file, dest_path)
-                logging.info(f"Copied {pdf_file} to {dest_path}")
-            except Exception as e:
-                logging.error(f"Error copying {pdf_file}: {e}")
-        
-        logging.info(f"\nSuccessfully copied {len(pdf_files)} PDF files to {PDF_DIR}")
+    """Copy all PDFs from source_dir to PDF_DIR, each as soon as it is found."""
+    copied = 0
+    for pdf_file in scan_files(source_dir, '.pdf'):
+        dest_path = os.path.join(PDF_DIR, os.path.basename(pdf_file))
+        try:
+            action = link_or_copy(pdf_file, dest_path)
+            logging.info(f"{action} {pdf_file} to {dest_path}")
+            copied += 1
+        except Exception as e:
+            logging.error(f"Error copying {pdf_file}: {e}")
+    
+    if copied:
+        logging.info(f"\nSuccessfully copied {copied} PDF files to {PDF_DIR}")
     else:
         logging.info("\nNo PDF files found in the extracted archive.")
 
@@ -666,34 +1595,52 @@ def process_file(file_path, is_pdf, pdf_index):
         if is_pdf:
             # Move PDF to PDF directory with sequential name
             new_pdf_path = os.path.join(PDF_DIR, f"example{pdf_index}.pdf")
-            shutil.copy2(file_path, new_pdf_path)
-            logging.info(f"PDF moved to {new_pdf_path}")
+            action = link_or_copy(file_path, new_pdf_path)
+            logging.info(f"PDF {action.lower()} to {new_pdf_path}")
             return True
         else:
-            # Extract archive
-            extract_dir = os.path.join(EXTRACTED_DIR, os.path.splitext(os.path.basename(file_path))[0])
-            if extract_archive(file_path, extract_dir):
-                # Find and move PDFs from extracted files
-                for root, _, files in os.walk(extract_dir):
-                    for file in files:
-                        if file.lower().endswith('.pdf'):
-                            pdf_path = os.path.join(root, file)
-                            new_pdf_path = os.path.join(PDF_DIR, f"example{pdf_index}.pdf")
-                            shutil.copy2(pdf_path, new_pdf_path)
-                            logging.info(f"Extracted PDF moved to {new_pdf_path}")
-                            return True
+            # Stream the archive's first PDF straight to the PDF directory; nothing else is written
+            new_pdf_path = os.path.join(PDF_DIR, f"example{pdf_index}.pdf")
+            with open(file_path, 'rb') as f:
+                archive_ext = sniff_extension(f.read(8))
+            try:
+                archive = open_archive(file_path, archive_ext)
+                if archive is not None:
+                    with archive:
+                        found = extract_first_pdf(archive, new_pdf_path)
+                    if found:
+                        logging.info(f"Extracted PDF to {new_pdf_path}")
+                    else:
+                        logging.info(f"No PDF files found in {file_path}")
+                    return found
+            except ARCHIVE_ERRORS as e:
+                logging.warning(f"Could not read {file_path} in-process ({e}), extracting it instead")
+            
+            # Other formats, or archives the in-process readers fail on, are extracted first
+            extract_dir = os.path.join(EXTRACTED_DIR, str(pdf_index), os.path.splitext(os.path.basename(file_path))[0])
+            if extract_archive(file_path, extract_dir, pdfs_only=True):
+                # Move the first PDF found in the extracted files; the scan stops there
+                pdf_path = next(scan_files(extract_dir, '.pdf'), None)
+                if pdf_path:
+                    action = link_or_copy(pdf_path, new_pdf_path)
+                    logging.info(f"Extracted PDF {action.lower()} to {new_pdf_path}")
+                    return True
             return False
     except Exception as e:
         logging.error(f"Error processing file: {e}")
         logging.error(traceback.format_exc())
         return False
 
-def process_alertalicitacao_url(url):
-    """Process an alertalicitacao URL to extract PNCP parameters and construct API URL."""
+@memoize_success
+def process_alertalicitacao_url(url, dest_dir=DOWNLOAD_DIR):
+    """
+    Process an alertalicitacao URL to extract PNCP parameters and construct API URL.
+    A Portal de Compras file that has to be downloaded with Playwright is saved into dest_dir.
+    """
     logging.info(f"Processing AlertaLicitacao URL: {url}")
     
     # Try 4-part PNCP format first
-    pncp_id_match = re.search(r'PNCP-(\d+)-(\d+)-(\d+)-(\d+)', url)
+    pncp_id_match = PNCP_ID_RE.search(url)
     if pncp_id_match:
         cnpj = pncp_id_match.group(1)
         sequence = pncp_id_match.group(2)
@@ -711,8 +1658,7 @@ def process_alertalicitacao_url(url):
         return pncp_url
     
     # Try 3-part PNCP format
-    pattern = r'PNCP-(\d+)-(\d+)-(\d+)'
-    pncp_id_match = re.search(pattern, url)
+    pncp_id_match = PNCP_ID_SHORT_RE.search(url)
     if pncp_id_match and len(pncp_id_match.groups()) >= 3:
         cnpj = pncp_id_match.group(1)
         sequence = pncp_id_match.group(2)
@@ -730,37 +1676,34 @@ def process_alertalicitacao_url(url):
         return pncp_url
     
     # Try PCP format
-    pcp_match = re.search(r'PCP-(\d+)-(\d+)-(\d+)', url)
+    pcp_match = PCP_ID_RE.search(url)
     if pcp_match:
         logging.info("Found PCP format URL, attempting to fetch original document URL...")
         try:
             # Get the AlertaLicitacao page
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(url, headers=headers)
+            response = SESSION.get(url, timeout=DEFAULT_TIMEOUT)
             response.raise_for_status()
             
             # Look for the original document URL
-            original_url_match = re.search(r'Visitar site original para mais detalhes: (https://[^\s<>"\']+)', response.text)
+            original_url_match = ORIGINAL_URL_RE.search(response.content)
             if original_url_match:
-                original_url = original_url_match.group(1)
+                original_url = original_url_match.group(1).decode('utf-8', errors='replace')
                 logging.info(f"Found original document URL: {original_url}")
                 
                 # If it's a Portal de Compras Públicas URL, process it
                 if 'portaldecompraspublicas.com.br' in original_url:
-                    return handle_portal_compras_publicas(original_url)
+                    return handle_portal_compras_publicas(original_url, dest_dir)
                 
                 return original_url
             
             # If we can't find the "Visitar site original" link, try finding any portaldecompraspublicas.com.br URL
-            portal_url_match = re.search(r'(https://www\.portaldecompraspublicas\.com\.br/[^\s<>"\']+)', response.text)
+            portal_url_match = PORTAL_URL_RE.search(response.content)
             if portal_url_match:
-                portal_url = portal_url_match.group(1)
+                portal_url = portal_url_match.group(1).decode('utf-8', errors='replace')
                 logging.info(f"Found Portal de Compras Públicas URL: {portal_url}")
                 
                 # Process the Portal de Compras Públicas URL
-                return handle_portal_compras_publicas(portal_url)
+                return handle_portal_compras_publicas(portal_url, dest_dir)
             
         except Exception as e:
             logging.error(f"Error fetching original document URL: {e}")
@@ -770,95 +1713,158 @@ def process_alertalicitacao_url(url):
     logging.error(f"URL format not recognized: {url}")
     return None
 
+def download_licitacao(index, licitacao, session=SESSION):
+    """
+    Download the edital of one licitação into its own folder.
+    Returns (success, file_path, is_pdf)
+    """
+    url = licitacao['link']
+    logging.info(f"\nProcessing URL {index}: {url}")
+    dest_dir = os.path.join(DOWNLOAD_DIR, str(index))
+    
+    try:
+        # Process alertalicitacao URLs
+        if 'alertalicitacao.com.br' in url:
+            pncp_url = process_alertalicitacao_url(url, dest_dir)
+            if pncp_url:
+                url = pncp_url
+            else:
+                logging.error(f"Failed to process alertalicitacao URL {index}.")
+                return False, None, False
+        
+        # Check if this URL might need dynamic handling
+        needs_playwright = False
+        direct_url = None
+        
+        # Portal de Compras URLs often need Playwright, unless the PDF can be found with plain HTTP.
+        # A page resolved in an earlier run is not fetched again while that result is valid
+        if 'portaldecompraspublicas.com.br' in url:
+            direct_url = remembered_resolution(url)
+        if 'portaldecompraspublicas.com.br' in url and not direct_url:
+            try:
+                response = session.get(url, timeout=PROBE_TIMEOUT)
+                direct_url = resolve_direct_pdf(url, response.content)
+                if not direct_url and (b'Baixar Arquivo' in response.content or b'Download' in response.content):
+                    logging.info("Detected potential dynamic Portal de Compras page")
+                    needs_playwright = True
+            except Exception as e:
+                logging.warning(f"Error pre-checking URL {url}: {e}")
+                # If we can't check, assume dynamic
+                needs_playwright = True
+        
+        # Try download approaches in sequence
+        success = False
+        file_path = None
+        is_pdf = False
+        
+        if direct_url:
+            success, file_path, is_pdf = download_file(direct_url, session=session, dest_dir=dest_dir)
+            if success:
+                logging.info("Downloaded the direct PDF URL without a browser")
+        
+        if needs_playwright and not success:
+            # Try Playwright first for known dynamic pages
+            logging.info("Using Playwright for dynamic page handling")
+            pdf_url = run_dynamic_download(url, dest_dir)
+            if pdf_url:
+                # If Playwright returned a URL, try downloading it
+                success, file_path, is_pdf = download_file(pdf_url, session=session, dest_dir=dest_dir)
+                if success:
+                    logging.info("Successfully downloaded file using Playwright")
+        
+        # If Playwright failed or wasn't needed, try regular download
+        if not success:
+            success, file_path, is_pdf = download_file(url, session=session, dest_dir=dest_dir)
+        
+        # Last resort - try with Playwright even if we didn't think it was needed
+        if not success and not needs_playwright:
+            logging.info("Regular download failed, trying with Playwright as fallback")
+            pdf_url = run_dynamic_download(url, dest_dir)
+            if pdf_url:
+                success, file_path, is_pdf = download_file(pdf_url, session=session, dest_dir=dest_dir)
+        
+        if not success:
+            logging.error(f"Download failed for URL {index} after trying all methods.")
+        return success, file_path, is_pdf
+    except Exception as e:
+        logging.error(f"Error processing URL {index}: {e}")
+        logging.error(traceback.format_exc())
+        return False, None, False
+
+def extract_licitacao(index, file_path, is_pdf):
+    """Move or extract the downloaded edital of one licitação into PDF_DIR. Returns True on success."""
+    if not process_file(file_path, is_pdf, index):
+        logging.error(f"File processing failed for URL {index}.")
+        return False
+    
+    logging.info(f"Successfully processed URL {index}")
+    return True
+
+def group_by_host(licitacoes):
+    """
+    Number the licitações from 1, drop repeated links and order the rest by hostname, so
+    consecutive downloads reuse the session's pooled connections to the same host.
+    Returns a list of (index, licitacao); each keeps the index of its first position in the JSON.
+    """
+    unique = {}
+    for index, licitacao in enumerate(licitacoes, 1):
+        url = licitacao['link']
+        if url in unique:
+            logging.info(f"Skipping URL {index}, it repeats URL {unique[url][0]}: {url}")
+            continue
+        unique[url] = (index, licitacao)
+    # sorted is stable, so links to the same host keep their JSON order
+    return sorted(unique.values(), key=lambda item: urlparse(item[1]['link']).netloc)
+
 def main():
     """Main function to handle downloading and extracting."""
     parser = argparse.ArgumentParser(description="Download and extract procurement documents from JSON file.")
     parser.add_argument("--json", help="Path to JSON file containing URLs", required=True)
-    parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+    parser.add_argument("--verbose", action="store_true", help="Enable verbose (DEBUG) logging")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of URLs to download concurrently (default: {DEFAULT_WORKERS})")
     
     global args
     args = parser.parse_args()
     
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+        console.setLevel(logging.DEBUG)
+    
     # Setup directories
     setup_directories()
     
     try:
         # Read JSON file
-        with open(args.json, 'r') as f:
-            data = json.load(f)
+        with open(args.json, 'rb') as f:
+            data = orjson.loads(f.read()) if orjson else json.load(f)
         
         if 'licitacoes' not in data:
             logging.error("JSON file does not contain 'licitacoes' key")
             return 1
         
-        # Process each URL
-        for index, licitacao in enumerate(data['licitacoes'], 1):
-            url = licitacao['link']
-            logging.info(f"\nProcessing URL {index}: {url}")
-            
-            # Process alertalicitacao URLs
-            if 'alertalicitacao.com.br' in url:
-                pncp_url = process_alertalicitacao_url(url)
-                if pncp_url:
-                    url = pncp_url
-                else:
-                    logging.error(f"Failed to process alertalicitacao URL {index}.")
-                    continue
-            
-            # Check if this URL might need dynamic handling
-            needs_playwright = False
-            
-            # Portal de Compras URLs often need Playwright
-            if 'portaldecompraspublicas.com.br' in url:
-                try:
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                    }
-                    response = requests.get(url, headers=headers, timeout=5)
-                    if 'Baixar Arquivo' in response.text or 'Download' in response.text:
-                        logging.info("Detected potential dynamic Portal de Compras page")
-                        needs_playwright = True
-                except Exception as e:
-                    logging.warning(f"Error pre-checking URL {url}: {e}")
-                    # If we can't check, assume dynamic
-                    needs_playwright = True
-            
-            # Try download approaches in sequence
-            success = False
-            file_path = None
-            is_pdf = False
-            
-            if needs_playwright:
-                # Try Playwright first for known dynamic pages
-                logging.info("Using Playwright for dynamic page handling")
-                pdf_url = asyncio.run(handle_dynamic_download(url))
-                if pdf_url:
-                    # If Playwright returned a URL, try downloading it
-                    success, file_path, is_pdf = download_file(pdf_url)
+        # Download the URLs concurrently and hand each finished download to the extraction
+        # pool right away; each index gets its own download folder and PDF name
+        licitacoes = group_by_host(data['licitacoes'])
+        failed = 0
+        if licitacoes:
+            with ThreadPoolExecutor(max_workers=min(args.workers, len(licitacoes))) as downloads, \
+                 ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS) as extractions:
+                download_futures = {downloads.submit(download_licitacao, index, licitacao, SESSION): index
+                                    for index, licitacao in licitacoes}
+                extract_futures = []
+                for future in as_completed(download_futures):
+                    success, file_path, is_pdf = future.result()
                     if success:
-                        logging.info("Successfully downloaded file using Playwright")
-            
-            # If Playwright failed or wasn't needed, try regular download
-            if not success:
-                success, file_path, is_pdf = download_file(url)
-            
-            # Last resort - try with Playwright even if we didn't think it was needed
-            if not success and not needs_playwright:
-                logging.info("Regular download failed, trying with Playwright as fallback")
-                pdf_url = asyncio.run(handle_dynamic_download(url))
-                if pdf_url:
-                    success, file_path, is_pdf = download_file(pdf_url)
-            
-            if not success:
-                logging.error(f"Download failed for URL {index} after trying all methods.")
-                continue
-            
-            # Process the downloaded file
-            if not process_file(file_path, is_pdf, index):
-                logging.error(f"File processing failed for URL {index}.")
-                continue
-            
-            logging.info(f"Successfully processed URL {index}")
+                        extract_futures.append(extractions.submit(extract_licitacao, download_futures[future], file_path, is_pdf))
+                    else:
+                        failed += 1
+                for future in as_completed(extract_futures):
+                    if not future.result():
+                        failed += 1
+        
+        if failed:
+            logging.warning(f"{failed} of {len(licitacoes)} URLs could not be processed.")
         
         logging.info("\nDownload and extraction complete!")
         logging.info(f"PDFs are available in the {PDF_DIR} directory.")
@@ -868,6 +1874,8 @@ def main():
         logging.error(f"Error processing JSON file: {e}")
         logging.error(traceback.format_exc())
         return 1
+    finally:
+        shutdown_playwright()
 
 if __name__ == "__main__":
     try:
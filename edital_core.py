@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Shared code for the edital analysis scripts
+
+This module handles:
+1. Extracting text from PDFs (PyMuPDF first, pdfplumber as fallback)
+2. Initializing Vertex AI
+3. Sending documents to Gemini through a reusable Analyzer, with an on-disk response cache
+"""
+
+import os
+import hashlib
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Directory setup
+PDF_DIR = "pdfs_simple"
+SUMMARY_DIR = "summaries"
+CACHE_DIR = os.path.join(SUMMARY_DIR, ".cache")
+
+# PDFs with at least this many pages are split across worker processes
+PARALLEL_PAGE_THRESHOLD = 20
+
+# Worker processes for page extraction, shared by every PDF extracted concurrently so the total
+# stays at MAX_EXTRACTION_PROCESSES. They are spawned rather than forked, since the callers
+# run extraction from threads and forking a multi-threaded process can deadlock the children
+MAX_EXTRACTION_PROCESSES = os.cpu_count() or 1
+extraction_pool = None
+extraction_pool_lock = threading.Lock()
+
+# pdfplumber text options: keep the PDF's own text order and skip layout reconstruction
+PDFPLUMBER_TEXT_OPTIONS = {"x_tolerance": 3, "y_tolerance": 3, "layout": False, "use_text_flow": True}
+
+def setup_directories():
+    """Create necessary directories if they don't exist."""
+    for directory in [PDF_DIR, SUMMARY_DIR, CACHE_DIR]:
+        os.makedirs(directory, exist_ok=True)
+    print(f"Directories set up: {PDF_DIR}, {SUMMARY_DIR}")
+
+def extract_page_range(pdf_path, start, stop):
+    """Extract the text of pages start..stop-1 of a PDF. Runs in a worker process."""
+    import pdfplumber
+    with pdfplumber.open(pdf_path, pages=range(start + 1, stop + 1)) as pdf:
+        return [page.extract_text(**PDFPLUMBER_TEXT_OPTIONS) for page in pdf.pages]
+
+def get_extraction_pool():
+    """Return the shared page extraction process pool, creating it on first use."""
+    global extraction_pool
+    with extraction_pool_lock:
+        if extraction_pool is None:
+            extraction_pool = ProcessPoolExecutor(max_workers=MAX_EXTRACTION_PROCESSES,
+                                                  mp_context=multiprocessing.get_context("spawn"))
+        return extraction_pool
+
+def extract_pages_in_parallel(pdf_path, page_count):
+    """Split the pages of a PDF into contiguous ranges and extract them in the shared worker processes."""
+    workers = min(MAX_EXTRACTION_PROCESSES, page_count)
+    chunk_size = -(-page_count // workers)  # ceiling division
+    starts = list(range(0, page_count, chunk_size))
+    stops = [min(start + chunk_size, page_count) for start in starts]
+    chunks = get_extraction_pool().map(extract_page_range, [pdf_path] * len(starts), starts, stops)
+    return [text for chunk in chunks for text in chunk]
+
+def extract_text_with_pymupdf(pdf_path, head_chars=None, tail_chars=0):
+    """Extract text from a PDF using PyMuPDF.
+
+    When head_chars is given, pages are read from the front until head_chars characters
+    are collected and from the back until tail_chars are, and the pages in between are
+    never parsed.
+    """
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        print(f"Processing {doc.page_count} pages with PyMuPDF")
+        if head_chars is None:
+            return "\n".join(page.get_text("text") for page in doc)
+
+        # Leading/trailing whitespace is stripped later, so it does not count towards the caps
+        head, tail = [], []
+        head_len = tail_len = 0
+        first, last = 0, doc.page_count - 1
+        while first <= last and head_len < head_chars:
+            page_text = doc[first].get_text("text")
+            head_len += len(page_text) if head_len else len(page_text.lstrip())
+            head.append(page_text)
+            first += 1
+        while first <= last and tail_len < tail_chars:
+            page_text = doc[last].get_text("text")
+            tail_len += len(page_text) if tail_len else len(page_text.rstrip())
+            tail.append(page_text)
+            last -= 1
+        if first <= last:
+            print(f"Skipped pages {first + 1}-{last + 1}, they are not sent for analysis")
+        return "\n".join(head + tail[::-1])
+
+def extract_text_with_pdfplumber(pdf_path):
+    """Extract text from a PDF using pdfplumber."""
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+        if page_count < PARALLEL_PAGE_THRESHOLD:
+            page_texts = []
+            for i, page in enumerate(pdf.pages):
+                if i % 10 == 0:
+                    print(f"Processing page {i+1}/{page_count}")
+                page_texts.append(page.extract_text(**PDFPLUMBER_TEXT_OPTIONS))
+        else:
+            print(f"Processing {page_count} pages in parallel")
+            page_texts = extract_pages_in_parallel(pdf_path, page_count)
+
+    # Collect the pieces and join once; repeated string += is quadratic on long documents
+    parts = []
+    for i, extracted in enumerate(page_texts):
+        if extracted:
+            parts.append(extracted)
+            parts.append("\n")
+        else:
+            print(f"Warning: No text extracted from page {i+1}")
+    return "".join(parts)
+
+def extract_text(pdf_path, head_chars=None, tail_chars=0):
+    """Extract the stripped text of a PDF using PyMuPDF, falling back to pdfplumber.
+
+    Returns an empty string when no text could be extracted.
+    """
+    print(f"Extracting text from {pdf_path}...")
+    try:
+        try:
+            text = extract_text_with_pymupdf(pdf_path, head_chars, tail_chars)
+        except Exception as e:
+            print(f"PyMuPDF could not read {pdf_path}: {e}")
+            text = ""
+
+        if not text.strip():
+            print("No text found with PyMuPDF, retrying with pdfplumber")
+            text = extract_text_with_pdfplumber(pdf_path)
+
+        if not text.strip():
+            print("Warning: No text was extracted from the PDF. It might be a scanned document.")
+            return ""
+
+        print(f"Successfully extracted {len(text)} characters of text")
+        return text.strip()
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+        traceback.print_exc()
+        return ""
+
+def initialize_vertex_ai(project_id, location):
+    """Initialize Vertex AI with the specified project and location.
+
+    Credentials are loaded here, synchronously, so the blocking read from disk does not
+    happen lazily inside the first (possibly async) Gemini call.
+    """
+    try:
+        print(f"Initializing Vertex AI with project: {project_id}, location: {location}")
+        import google.auth
+        from google.cloud import aiplatform
+        credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+        aiplatform.init(project=project_id, location=location, credentials=credentials)
+        return True
+    except Exception as e:
+        print(f"Error initializing Vertex AI: {e}")
+        traceback.print_exc()
+        return False
+
+def response_cache_path(model_name, *prompt_parts):
+    """Return the cache file for a model response, keyed by a hash of the model and prompt parts."""
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    for part in prompt_parts:
+        digest.update(part.encode("utf-8"))
+    return os.path.join(CACHE_DIR, f"{digest.hexdigest()}.txt")
+
+def read_cached_response(cache_path):
+    """Return a previously cached model response, or None on a cache miss."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def write_text_atomic(path, text):
+    """Write text to a temporary file and move it into place, so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def write_cached_response(cache_path, response_text):
+    """Store a model response in the cache; failures only cost a future cache miss."""
+    try:
+        write_text_atomic(cache_path, response_text)
+    except OSError as e:
+        print(f"Warning: Could not write response cache {cache_path}: {e}")
+
+class Analyzer:
+    """Send documents to one Gemini model, created once and reused for every PDF.
+
+    prompt is a static instruction sent before each document. With cached_content
+    (a Vertex AI context cache holding that prompt) only the document is sent.
+    Responses are cached on disk, keyed by the model, prompt and document.
+    """
+
+    def __init__(self, model_name, prompt=None, generation_config=None, cached_content=None):
+        self.model_name = model_name
+        self.prompt = prompt
+        self.generation_config = generation_config
+        self.cached_content = cached_content
+        self._model = None
+
+    @property
+    def model(self):
+        """The GenerativeModel instance, created on first use."""
+        if self._model is None:
+            from vertexai.preview.generative_models import GenerativeModel
+            if self.cached_content is not None:
+                self._model = GenerativeModel.from_cached_content(cached_content=self.cached_content)
+            else:
+                self._model = GenerativeModel(self.model_name)
+            print(f"Model initialized: {self.model_name}")
+        return self._model
+
+    def _request(self, text):
+        """Return the response cache path and the contents to send for a document."""
+        if self.prompt is None:
+            return response_cache_path(self.model_name, text), text
+        cache_path = response_cache_path(self.model_name, self.prompt, text)
+        if self.cached_content is not None:
+            return cache_path, text
+        # Send the prompt and the document as separate parts instead of concatenating them
+        return cache_path, [self.prompt, text]
+
+    def _store(self, cache_path, response):
+        """Cache and return the text of a response, or None if it has no text."""
+        if not hasattr(response, "text"):
+            print("Warning: Unexpected response format from Gemini API")
+            return None
+        write_cached_response(cache_path, response.text)
+        return response.text
+
+    def analyze(self, text):
+        """Return the model's analysis of text, or None if the response had no text."""
+        cache_path, contents = self._request(text)
+        cached_analysis = read_cached_response(cache_path)
+        if cached_analysis is not None:
+            print(f"Using cached analysis from {cache_path}")
+            return cached_analysis
+
+        print(f"Analyzing text with Gemini model: {self.model_name}...")
+        response = self.model.generate_content(contents, generation_config=self.generation_config)
+        return self._store(cache_path, response)
+
+    async def analyze_async(self, text):
+        """Like analyze, but awaits the model call instead of blocking the event loop."""
+        cache_path, contents = self._request(text)
+        cached_analysis = read_cached_response(cache_path)
+        if cached_analysis is not None:
+            print(f"Using cached analysis from {cache_path}")
+            return cached_analysis
+
+        print(f"Analyzing text with Gemini model: {self.model_name}...")
+        response = await self.model.generate_content_async(contents, generation_config=self.generation_config)
+        return self._store(cache_path, response)
@@ -0,0 +1,172 @@
+import io
+import os
+import sys
+import subprocess
+import zipfile
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("lxml")
+pytest.importorskip("playwright")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import download_edital  # noqa: E402
+
+# Compression method number of Deflate64, which zipfile cannot decompress
+DEFLATE64 = 9
+# General purpose flag bit marking a ZIP member as encrypted
+ENCRYPTED = 0x1
+
+def make_zip(path, method=None, flags=None):
+    """Write a ZIP holding one PDF, with its header fields patched to the given method/flags."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr('edital.pdf', b'%PDF-1.4 test')
+    data = bytearray(buffer.getvalue())
+    # (signature, flags offset, method offset) of the local and central directory headers
+    for signature, flags_offset, method_offset in ((b'PK\x03\x04', 6, 8), (b'PK\x01\x02', 8, 10)):
+        start = data.index(signature)
+        if method is not None:
+            data[start + method_offset:start + method_offset + 2] = method.to_bytes(2, 'little')
+        if flags is not None:
+            data[start + flags_offset:start + flags_offset + 2] = flags.to_bytes(2, 'little')
+    with open(path, 'wb') as f:
+        f.write(data)
+
+@pytest.fixture
+def fake_unar(monkeypatch):
+    """Replace unar with a stand-in that records its calls and extracts a PDF like unar would."""
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        extract_dir = args[args.index('-o') + 1]
+        os.makedirs(extract_dir, exist_ok=True)
+        with open(os.path.join(extract_dir, 'edital.pdf'), 'wb') as f:
+            f.write(b'%PDF-1.4 from unar')
+        return subprocess.CompletedProcess(args, 0, stdout='', stderr='')
+
+    monkeypatch.setattr(download_edital.subprocess, 'run', run)
+    return calls
+
+@pytest.mark.parametrize('header', [{'method': DEFLATE64}, {'flags': ENCRYPTED}], ids=['deflate64', 'encrypted'])
+def test_extract_archive_falls_back_to_unar(tmp_path, fake_unar, header):
+    archive_path = str(tmp_path / 'edital.zip')
+    make_zip(archive_path, **header)
+
+    assert download_edital.extract_archive(archive_path, str(tmp_path / 'out'), pdfs_only=True)
+    assert fake_unar and fake_unar[0][0] == 'unar'
+
+@pytest.mark.parametrize('header', [{'method': DEFLATE64}, {'flags': ENCRYPTED}], ids=['deflate64', 'encrypted'])
+def test_process_file_falls_back_to_unar(tmp_path, monkeypatch, fake_unar, header):
+    monkeypatch.setattr(download_edital, 'PDF_DIR', str(tmp_path / 'pdfs'))
+    monkeypatch.setattr(download_edital, 'EXTRACTED_DIR', str(tmp_path / 'extracted'))
+    os.makedirs(download_edital.PDF_DIR)
+    archive_path = str(tmp_path / 'edital.zip')
+    make_zip(archive_path, **header)
+
+    assert download_edital.process_file(archive_path, False, 1)
+    assert fake_unar
+    with open(os.path.join(download_edital.PDF_DIR, 'example1.pdf'), 'rb') as f:
+        assert f.read() == b'%PDF-1.4 from unar'
+
+def test_extract_first_pdf_leaves_no_partial_file(tmp_path):
+    archive_path = str(tmp_path / 'edital.zip')
+    make_zip(archive_path)
+    # Corrupt the member data so reading it fails the CRC check
+    with open(archive_path, 'r+b') as f:
+        data = f.read()
+        f.seek(data.index(b'%PDF'))
+        f.write(b'XXXX')
+    dest_path = str(tmp_path / 'edital.pdf')
+
+    with zipfile.ZipFile(archive_path) as archive, pytest.raises(zipfile.BadZipFile):
+        download_edital.extract_first_pdf(archive, dest_path)
+    assert not os.path.exists(f"{dest_path}.part")
+    assert not os.path.exists(dest_path)
+
+def test_cached_download_rejects_replaced_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(download_edital, 'DOWNLOAD_CACHE_FILE', str(tmp_path / 'cache_index.json'))
+    monkeypatch.setattr(download_edital, 'download_cache', None)
+    first_dir, other_dir = tmp_path / '1', tmp_path / '2'
+    first_dir.mkdir()
+    file_path = str(first_dir / 'edital.pdf')
+    with open(file_path, 'wb') as f:
+        f.write(b'%PDF-1.4 first')
+    download_edital.record_download('https://example.com/a', {'ETag': '"a"'}, file_path, True)
+
+    cached = download_edital.cached_download('https://example.com/a', str(other_dir))
+    assert cached['path'] == str(other_dir / 'edital.pdf')
+
+    # Another URL's download replaces the file at the recorded path
+    replacement = str(first_dir / 'edital.pdf.part')
+    with open(replacement, 'wb') as f:
+        f.write(b'%PDF-1.4 other')
+    os.replace(replacement, file_path)
+    os.remove(cached['path'])
+    assert download_edital.cached_download('https://example.com/a', str(other_dir)) is None
+
+@pytest.fixture
+def resolution_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(download_edital, 'RESOLUTION_CACHE_FILE', str(tmp_path / 'portal_resolutions.json'))
+    monkeypatch.setattr(download_edital, 'resolutions', None)
+    monkeypatch.setattr(download_edital, 'pending_resolutions', {})
+
+def test_resolution_is_remembered_only_once_confirmed(resolution_cache):
+    page_url = 'https://www.portaldecompraspublicas.com.br/processos/sc/x/pe-1-2024'
+    pdf_url = 'https://www.portaldecompraspublicas.com.br/3/upl/edital.pdf'
+    download_edital.remember_resolution(page_url, pdf_url, {})
+    assert download_edital.remembered_resolution(page_url) is None
+
+    download_edital.confirm_resolution(pdf_url)
+    assert download_edital.remembered_resolution(page_url) == pdf_url
+
+def test_guessed_fallback_is_never_remembered(resolution_cache):
+    page_url = 'https://www.portaldecompraspublicas.com.br/processos/sc/x/pe-1-2024'
+    download_edital.remember_resolution(page_url, download_edital.SAMAE_UPL_URL, {'ETag': '"a"'})
+    download_edital.confirm_resolution(download_edital.SAMAE_UPL_URL)
+    assert download_edital.remembered_resolution(page_url) is None
+
+def test_portal_playwright_download_goes_to_dest_dir(tmp_path, monkeypatch, resolution_cache):
+    class Page:
+        content = b'<html><button>Baixar Arquivo</button></html>'
+        headers = {}
+
+    calls = []
+    monkeypatch.setattr(download_edital.SESSION, 'get', lambda *args, **kwargs: Page())
+    monkeypatch.setattr(download_edital, 'resolve_direct_pdf', lambda *args: None)
+    monkeypatch.setattr(download_edital, 'run_dynamic_download',
+                        lambda url, dest_dir: calls.append(dest_dir) or f"file://{dest_dir}/edital.pdf")
+
+    url = 'https://www.portaldecompraspublicas.com.br/processos/sc/dest-dir-test/pe-2-2024'
+    dest_dir = str(tmp_path / '7')
+    assert download_edital.handle_portal_compras_publicas(url, dest_dir) == f"file://{dest_dir}/edital.pdf"
+    assert calls == [dest_dir]
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://alertalicitacao.com.br/!licitacao/PNCP-111-1-22-2025',
+     'https://pncp.gov.br/pncp-api/v1/orgaos/111/compras/2025/22/arquivos/1'),
+    ('https://alertalicitacao.com.br/!licitacao/PNCP-111-1-22',
+     'https://pncp.gov.br/pncp-api/v1/orgaos/111/compras/2024/22/arquivos/1'),
+    # A PCP ID before the PNCP ID must not take precedence over it
+    ('https://alertalicitacao.com.br/!licitacao/PCP-4215802-5-812024/PNCP-111-1-22-2025',
+     'https://pncp.gov.br/pncp-api/v1/orgaos/111/compras/2025/22/arquivos/1'),
+    # Likewise a 3-part PNCP ID before a 4-part one
+    ('https://alertalicitacao.com.br/PNCP-333-3-33/PNCP-111-1-22-2025',
+     'https://pncp.gov.br/pncp-api/v1/orgaos/111/compras/2025/22/arquivos/1'),
+], ids=['pncp-4-part', 'pncp-3-part', 'pcp-before-pncp', 'short-before-long'])
+def test_process_alertalicitacao_url_prefers_pncp(url, expected):
+    assert download_edital.process_alertalicitacao_url(url) == expected
+
+def test_selector_hits_are_saved_only_at_shutdown(tmp_path, monkeypatch):
+    hits_file = tmp_path / 'selector_hits.json'
+    monkeypatch.setattr(download_edital, 'SELECTOR_HITS_FILE', str(hits_file))
+    monkeypatch.setattr(download_edital, 'selector_hits', None)
+
+    rule = download_edital.DOWNLOAD_BUTTON_RULES[0]
+    download_edital.record_selector_hit(rule)
+    assert not hits_file.exists()
+
+    download_edital.save_selector_hits()
+    assert download_edital.load_json(str(hits_file)) == {download_edital.describe_rule(rule): 1}